@@ -0,0 +1,74 @@
+import unittest
+import prefix_tree
+from prefix_tree import SimplePrefixTree, CompressedPrefixTree
+from tree_test_helpers import repr_tree, fill
+
+
+UPDATES = [('door', 5.0, ['d', 'o', 'o', 'r']),
+           ('cat', 50.0, ['c', 'a', 't']),
+           ('dog', 3.0, ['d', 'o', 'g']),
+           ('door', 1.0, ['d', 'o', 'o', 'r']),
+           ('cat', 40.0, ['c', 'a', 't'])]
+
+
+class ApplyUpdatesTest(unittest.TestCase):
+
+    def setUp(self):
+        # Take the batch path even for these small batches.
+        self.batch_size = prefix_tree.APPLY_BATCH_SIZE
+        prefix_tree.APPLY_BATCH_SIZE = 0
+
+    def tearDown(self):
+        prefix_tree.APPLY_BATCH_SIZE = self.batch_size
+
+    def test_same_as_insert(self):
+        for tree_class in [SimplePrefixTree, CompressedPrefixTree]:
+            for weight_type in ['sum', 'average', 'max']:
+                inserted = fill(tree_class(weight_type))
+                applied = fill(tree_class(weight_type))
+                for value, delta, prefix in UPDATES:
+                    inserted.insert(value, delta, prefix)
+                applied.apply_updates(UPDATES)
+                self.assertEqual(repr_tree(applied), repr_tree(inserted))
+                self.assertEqual(len(applied), 6)
+
+    def test_reorders_children(self):
+        for tree_class in [SimplePrefixTree, CompressedPrefixTree]:
+            tree = fill(tree_class('sum'))
+            tree.apply_updates([('door', 200.0, ['d', 'o', 'o', 'r']),
+                                ('cat', 90.0, ['c', 'a', 't'])])
+            self.assertEqual(tree.autocomplete([], 3),
+                             [('door', 204.0), ('cat', 110.0),
+                              ('car', 100.0)])
+            self.assertEqual(tree.autocomplete(['c', 'a']),
+                             [('cat', 110.0), ('car', 100.0),
+                              ('care', 30.0)])
+
+    def test_top_lists(self):
+        tree = fill(CompressedPrefixTree('sum', 2))
+        tree.apply_updates([('danger', 10.0, ['d', 'a', 'n', 'g', 'e', 'r']),
+                            ('care', 80.0, ['c', 'a', 'r', 'e'])])
+        self.assertEqual(tree.autocomplete([], 2),
+                         [('care', 110.0), ('car', 100.0)])
+        self.assertEqual(tree.autocomplete(['d'], 1), [('danger', 16.0)])
+
+    def test_empty_tree(self):
+        tree = SimplePrefixTree('sum')
+        tree.apply_updates(UPDATES)
+        self.assertEqual(tree.autocomplete([]), [('cat', 90.0),
+                                                 ('door', 6.0),
+                                                 ('dog', 3.0)])
+
+    def test_small_batch(self):
+        prefix_tree.APPLY_BATCH_SIZE = self.batch_size
+        for tree_class in [SimplePrefixTree, CompressedPrefixTree]:
+            inserted = fill(tree_class('sum'))
+            applied = fill(tree_class('sum'))
+            for value, delta, prefix in UPDATES:
+                inserted.insert(value, delta, prefix)
+            applied.apply_updates(UPDATES)
+            self.assertEqual(repr_tree(applied), repr_tree(inserted))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -15,29 +15,155 @@ top-level functions to this file.
 """
 from __future__ import annotations
 import csv
-from typing import Any, Dict, List, Optional, Tuple
+import mmap
+import os
+import string
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 from melody import Melody
-from prefix_tree import SimplePrefixTree, CompressedPrefixTree
+from prefix_tree import Autocompleter, SimplePrefixTree, \
+    CompressedPrefixTree, FrozenPrefixTree, PrefixCursor, CallStats, \
+    load_tree, paused_gc
+from sharded_tree import ShardedAutocompleter
+
+
+# How many bytes of a file letter_engine_records sanitizes at a time.
+CHUNK_SIZE = 1 << 20
+
+# The bytes.translate arguments that sanitize ASCII text: upper case letters
+# become lower case, and every other byte below 128 except letters, digits,
+# spaces and newlines is deleted. Bytes from 128 up are kept for
+# letter_engine_sanitizer to deal with.
+ASCII_LOWER = bytes.maketrans(string.ascii_uppercase.encode(),
+                              string.ascii_lowercase.encode())
+ASCII_DELETE = bytes(byte for byte in range(128)
+                     if not (chr(byte).isalnum() or chr(byte) in ' \n'))
 
 
 def letter_engine_sanitizer(line: str) -> list:
     """Return the sanitized value  and its prefix that is going to be inserted
     for <line>
     """
-    text = ''
-    final_text = ''
-    prefix = []
-    for letter in line:
-        text += letter
-    text = text.lower()
-    i = 0
-    while i < len(text):
-        if text[i].isalnum() or text[i] == ' ':
-            final_text += text[i]
-            prefix.append(text[i])
-        i += 1
-    return [final_text, prefix]
+    text = line.lower()
+    final_text = ''.join([char for char in text
+                          if char.isalnum() or char == ' '])
+    return [final_text, list(final_text)]
+
+
+def letter_engine_records(path: str) -> Iterator[Tuple[str, List[str]]]:
+    """Yield the sanitized value and prefix of each line of the UTF-8 text
+    file <path> that has at least one alphanumeric character, in order.
+
+    This gives the same records as letter_engine_sanitizer on each line of
+    the file, but the file is memory-mapped and sanitized CHUNK_SIZE bytes at
+    a time by bytes.translate, and decoded once per chunk. Only the lines
+    with non-ASCII characters left go through letter_engine_sanitizer.
+    """
+    for values in letter_value_chunks(path):
+        yield from zip(values, map(list, values))
+
+
+def letter_value_chunks(path: str, start: int = 0,
+                        end: Optional[int] = None) -> Iterator[List[str]]:
+    """Yield the values of letter_engine_records for the lines in bytes
+    <start> to <end> of the file <path>, a list for each chunk.
+
+    Precondition: <start> and <end> are 0, the size of the file, or just
+    after a newline.
+    """
+    with open(path, 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # An empty file cannot be mapped.
+            return
+    with data:
+        stop = len(data) if end is None else end
+        while start < stop:
+            end = start + CHUNK_SIZE
+            if end >= stop:
+                end = stop
+            else:
+                # End the chunk after its last newline, or if it has none,
+                # after the end of the line it is part of.
+                end = data.rfind(b'\n', start, end) + 1 \
+                    or data.find(b'\n', end, stop) + 1 or stop
+            chunk = data[start:end]
+            start = end
+            if b'\r' in chunk:
+                # Text files also end lines with '\r' or '\r\n'; the empty
+                # lines this makes are skipped like any other.
+                chunk = chunk.replace(b'\r', b'\n')
+            lines = chunk.translate(ASCII_LOWER, ASCII_DELETE).decode(
+                'utf8').split('\n')
+            if not chunk.isascii():
+                raw_lines = chunk.split(b'\n')
+                for i, ascii_only in enumerate(map(str.isascii, lines)):
+                    if not ascii_only:
+                        lines[i] = letter_engine_sanitizer(
+                            raw_lines[i].decode('utf8'))[0]
+            # Skip the lines without an alphanumeric character (the values
+            # left are letters, digits and spaces).
+            yield list(filter(str.strip, lines))
+
+
+def count_letter_values(path: str, start: int = 0,
+                        end: Optional[int] = None) -> Counter:
+    """Return how many times each value of letter_value_chunks(path, start,
+    end) occurs, in the order of first occurrence.
+    """
+    counts = Counter()
+    for values in letter_value_chunks(path, start, end):
+        counts.update(values)
+    return counts
+
+
+def line_ranges(path: str, parts: int) -> List[Tuple[int, int]]:
+    """Split the file <path> into up to <parts> ranges of about the same
+    number of bytes, each made of whole lines, and return their (start, end)
+    offsets.
+    """
+    size = os.path.getsize(path)
+    ranges = []
+    start = 0
+    with open(path, 'rb') as f:
+        for i in range(1, parts + 1):
+            if i == parts:
+                end = size
+            else:
+                f.seek(max(start, size * i // parts))
+                f.readline()
+                end = f.tell()
+            if end > start:
+                ranges.append((start, end))
+                start = end
+    return ranges
+
+
+def build_letter_tree(root: Autocompleter, path: str,
+                      workers: int = 0) -> None:
+    """Insert the records of letter_engine_records(path) into the empty
+    tree <root>, each with a weight of one.
+
+    Repeated values are counted first, so that the tree is built from the
+    distinct values. If <workers> is more than 1, the lines of the file are
+    split into that many ranges, which are read and counted by that many
+    processes at once.
+    """
+    if workers <= 1:
+        counts = count_letter_values(path)
+    else:
+        ranges = line_ranges(path, workers)
+        counts = Counter()
+        with ProcessPoolExecutor(workers) as pool:
+            for part in pool.map(count_letter_values, [path] * len(ranges),
+                                 [start for start, _ in ranges],
+                                 [end for _, end in ranges]):
+                counts.update(part)
+    root.bulk_load([(value, float(n), list(value))
+                    for value, n in counts.items()])
 
 
 def sentence_engine_sanitizer(line: list) -> str:
@@ -56,6 +182,269 @@ def sentence_engine_sanitizer(line: list) -> str:
     return final_text
 
 
+def sentence_engine_items(path: str) -> List[Tuple[str, float, List[str]]]:
+    """Return the (value, weight, prefix) tuples a sentence engine inserts
+    for the CSV file <path>, skipping the lines without a word.
+    """
+    with open(path) as csvfile:
+        reader = csv.reader(csvfile)
+        items = []
+        for line in reader:
+            final_text = sentence_engine_sanitizer(line)
+            if final_text.strip() != '':
+                prefix = final_text.split()
+                items.append((final_text, float(line[1]), prefix))
+    return items
+
+
+class ResultCache:
+    """A bounded cache of autocomplete results, keyed by (prefix, limit).
+
+    When the cache is full, the least recently used entry is evicted.
+
+    === Attributes ===
+    max_size: The most entries this cache holds. 0 turns the cache off.
+    hits: The number of lookups that found an entry.
+    misses: The number of lookups that did not.
+    evictions: The number of entries evicted to make room for new ones.
+
+    === Private Attributes ===
+    _entries:
+        Maps (prefix, limit) to the cached results, least recently used first.
+    _limits:
+        Maps each cached prefix to the limits it is cached with.
+    """
+    max_size: int
+    hits: int
+    misses: int
+    evictions: int
+    _entries: OrderedDict
+    _limits: Dict[Tuple, List[Optional[int]]]
+
+    def __init__(self, max_size: int) -> None:
+        """Initialize an empty cache holding at most <max_size> entries.
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._limits = {}
+
+    def __len__(self) -> int:
+        """Return the number of entries in this cache."""
+        return len(self._entries)
+
+    def get(self, prefix: Tuple, limit: Optional[int]) -> Optional[List]:
+        """Return a copy of the results cached for <prefix> and <limit>, or None
+        if there are none.
+        """
+        results = self._entries.get((prefix, limit))
+        if results is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end((prefix, limit))
+        self.hits += 1
+        return list(results)
+
+    def put(self, prefix: Tuple, limit: Optional[int], results: List) -> None:
+        """Cache a copy of <results> for <prefix> and <limit>.
+        """
+        if self.max_size <= 0:
+            return
+        if (prefix, limit) not in self._entries:
+            self._limits.setdefault(prefix, []).append(limit)
+        self._entries[prefix, limit] = list(results)
+        self._entries.move_to_end((prefix, limit))
+        while len(self._entries) > self.max_size:
+            (old, old_limit), _ = self._entries.popitem(last=False)
+            self._limits[old].remove(old_limit)
+            if self._limits[old] == []:
+                del self._limits[old]
+            self.evictions += 1
+
+    def invalidate_insert(self, prefix: Tuple) -> None:
+        """Drop the entries changed by inserting a value with <prefix>.
+
+        Those are exactly the entries whose prefix is a prefix of <prefix>.
+        """
+        for i in range(len(prefix) + 1):
+            if prefix[:i] in self._limits:
+                self._drop(prefix[:i])
+
+    def invalidate_remove(self, prefix: Tuple) -> None:
+        """Drop the entries changed by removing the values matching <prefix>.
+
+        Those are the entries whose prefix is a prefix of <prefix>, or starts
+        with <prefix>.
+        """
+        for cached in list(self._limits):
+            if cached[:len(prefix)] == prefix \
+                    or prefix[:len(cached)] == cached:
+                self._drop(cached)
+
+    def invalidate_remove_many(self, prefixes: List[Tuple]) -> None:
+        """Drop the entries changed by removing the values matching any prefix
+        in <prefixes>, looking at each cached prefix once.
+        """
+        removed = set(prefixes)
+        above = {prefix[:i] for prefix in removed
+                 for i in range(len(prefix) + 1)}
+        for cached in list(self._limits):
+            if cached in above or any(cached[:i] in removed
+                                      for i in range(len(cached) + 1)):
+                self._drop(cached)
+
+    def _drop(self, prefix: Tuple) -> None:
+        """Drop every entry for <prefix>.
+        """
+        for limit in self._limits.pop(prefix):
+            del self._entries[prefix, limit]
+
+    def info(self) -> Dict[str, float]:
+        """Return the statistics of this cache.
+        """
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups > 0 else 0.0,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'max_size': self.max_size}
+
+
+def cached_autocomplete_many(cache: ResultCache, autocompleter: Autocompleter,
+                             prefixes: List[List],
+                             limit: Optional[int] = None) -> List[List]:
+    """Return autocompleter.autocomplete(prefix, limit) for each prefix in
+    <prefixes>, in the same order, using and filling <cache>.
+    """
+    results = [None] * len(prefixes)
+    missing = []
+    for i in range(len(prefixes)):
+        results[i] = cache.get(tuple(prefixes[i]), limit)
+        if results[i] is None:
+            missing.append(i)
+    found = autocompleter.autocomplete_many([prefixes[i] for i in missing],
+                                            limit)
+    for i, result in zip(missing, found):
+        results[i] = result
+        cache.put(tuple(prefixes[i]), limit, result)
+    return results
+
+
+class EngineStats:
+    """The statistics of the prefix tree calls made by an engine created with
+    the 'stats' option.
+
+    === Attributes ===
+    last: The statistics of the most recent call, or None before any call.
+
+    === Private Attributes ===
+    _totals:
+        Maps each operation to the sum of the statistics of its calls.
+    """
+    last: Optional[CallStats]
+    _totals: Dict[str, CallStats]
+
+    def __init__(self) -> None:
+        """Initialize statistics with no calls recorded.
+        """
+        self.last = None
+        self._totals = {}
+
+    def record(self, stats: CallStats) -> None:
+        """Record the statistics of one call.
+        """
+        self.last = stats
+        if stats.operation in self._totals:
+            self._totals[stats.operation].add(stats)
+        else:
+            total = CallStats(stats.operation)
+            total.calls = 0
+            total.add(stats)
+            self._totals[stats.operation] = total
+
+    def info(self) -> Dict[str, Dict[str, int]]:
+        """Return the total counts of the calls of each operation.
+        """
+        return {operation: total.info()
+                for operation, total in self._totals.items()}
+
+
+class LetterSession:
+    """The text typed so far into a type-ahead box backed by a
+    LetterAutocompleteEngine.
+
+    Each typed character moves a PrefixCursor one step down the engine's
+    prefix tree, so a keystroke does not search from the root again.
+
+    === Private Attributes ===
+    _engine:
+        The engine this session queries.
+    _cursor:
+        The cursor for the text typed so far, or None if the engine's
+        autocompleter is not a SimplePrefixTree or CompressedPrefixTree.
+    _text:
+        The text typed so far.
+    _version:
+        The engine's version when the cursor last matched the engine's tree.
+    """
+    _engine: LetterAutocompleteEngine
+    _cursor: Optional[PrefixCursor]
+    _text: str
+    _version: int
+
+    def __init__(self, engine: LetterAutocompleteEngine) -> None:
+        """Initialize a session with no text typed into <engine>.
+        """
+        self._engine = engine
+        if isinstance(engine.autocompleter,
+                      (SimplePrefixTree, CompressedPrefixTree)):
+            self._cursor = PrefixCursor(engine.autocompleter)
+        else:
+            self._cursor = None
+        self._text = ''
+        self._version = engine._version
+
+    @property
+    def text(self) -> str:
+        """The text typed so far.
+        """
+        return self._text
+
+    def type(self, chars: str) -> None:
+        """Add the characters <chars> to the end of the text.
+
+        Precondition: <chars> contains only lowercase alphanumeric characters
+                      and spaces.
+        """
+        self._text += chars
+        if self._cursor is not None:
+            for char in chars:
+                self._cursor.type(char)
+
+    def backspace(self) -> None:
+        """Remove the last character of the text, if there is one.
+        """
+        if self._text != '':
+            self._text = self._text[:-1]
+            if self._cursor is not None:
+                self._cursor.backspace()
+
+    def autocomplete(self, limit: Optional[int] = None) \
+            -> List[Tuple[str, float]]:
+        """Return up to <limit> matches for the text typed so far, like
+        LetterAutocompleteEngine.autocomplete.
+        """
+        if self._cursor is None:
+            return self._engine.autocomplete(self._text, limit)
+        if self._version != self._engine._version:
+            self._cursor.refresh()
+            self._version = self._engine._version
+        return self._cursor.autocomplete(limit)
+
+
 ################################################################################
 # Text-based Autocomplete Engines (Task 4)
 ################################################################################
@@ -71,8 +460,16 @@ class LetterAutocompleteEngine:
 
     === Attributes ===
     autocompleter: An Autocompleter used by this engine.
+
+    === Private Attributes ===
+    _cache: The results of recent autocomplete calls.
+    _version: The number of times insert or remove was called.
+    _stats: The statistics of the calls, or None if they are not counted.
     """
     autocompleter: Autocompleter
+    _cache: ResultCache
+    _version: int
+    _stats: Optional[EngineStats]
 
     def __init__(self, config: Dict[str, Any]) -> None:
         """Initialize this engine with the given configuration.
@@ -81,8 +478,21 @@ class LetterAutocompleteEngine:
             - 'file': the path to a text file
             - 'autocompleter': either the string 'simple' or 'compressed',
               specifying which subclass of Autocompleter to use.
-            - 'weight_type': either 'sum' or 'average', which specifies the
+            - 'weight_type': 'sum', 'average' or 'max', which specifies the
               weight type for the prefix tree.
+            - 'cache_size' (optional): how many autocomplete results to
+              cache. Defaults to 0, i.e. no caching.
+            - 'top_k' (optional): for a compressed autocompleter, how many of
+              the heaviest leaves each of its trees keeps in a list, to
+              answer autocomplete calls with small limits. Defaults to 0.
+            - 'stats' (optional): if True, count the work done by each insert,
+              autocomplete and remove call (see stats_info). Defaults to
+              False.
+            - 'remove_threshold' (optional): if positive, remove calls are
+              lazy, and the prefix tree is compacted once this many are
+              pending (see compact). Defaults to 0.
+            - 'workers' (optional): if more than 1, the file is read by this
+              many processes (see build_letter_tree). Defaults to 0.
 
         Each line of the specified file counts as one input string.
         Note that the line may or may not contain spaces.
@@ -103,12 +513,19 @@ class LetterAutocompleteEngine:
         if config['autocompleter'] == 'simple':
             self.autocompleter = SimplePrefixTree(config['weight_type'])
         elif config['autocompleter'] == 'compressed':
-            self.autocompleter = CompressedPrefixTree(config['weight_type'])
-        with open(config['file'], encoding='utf8') as f:
-            for line in f:
-                result = letter_engine_sanitizer(line)
-                if result[0].strip != '':  # skip lines w/o alphanumeric char
-                    self.autocompleter.insert(result[0], 1.0, result[1])
+            self.autocompleter = CompressedPrefixTree(config['weight_type'],
+                                                      config.get('top_k', 0))
+        self._cache = ResultCache(config.get('cache_size', 0))
+        self._version = 0
+        self._stats = EngineStats() if config.get('stats', False) else None
+        # Lines without an alphanumeric character are skipped. Like the
+        # build, reading allocates nothing that becomes garbage.
+        with paused_gc():
+            build_letter_tree(self.autocompleter, config['file'],
+                              config.get('workers', 0))
+        if config.get('remove_threshold', 0) > 0:
+            self.autocompleter.set_removal_threshold(
+                config['remove_threshold'])
 
     def autocomplete(self, prefix: str,
                      limit: Optional[int] = None) -> List[Tuple[str, float]]:
@@ -129,7 +546,61 @@ class LetterAutocompleteEngine:
         prefix_list = []
         for char in prefix:
             prefix_list.append(char)
-        return self.autocompleter.autocomplete(prefix_list, limit)
+        key = tuple(prefix_list)
+        stats = None if self._stats is None else CallStats('autocomplete')
+        results = self._cache.get(key, limit)
+        if results is None:
+            results = self.autocompleter.autocomplete(prefix_list, limit,
+                                                      stats)
+            self._cache.put(key, limit, results)
+        if stats is not None:
+            self._stats.record(stats)
+        return results
+
+    def autocomplete_many(self, prefixes: List[str],
+                          limit: Optional[int] = None) \
+            -> List[List[Tuple[str, float]]]:
+        """Return autocomplete(prefix, limit) for each prefix string in
+        <prefixes>, in the same order.
+
+        The prefixes that are not cached are looked up together with
+        Autocompleter.autocomplete_many.
+        """
+        return cached_autocomplete_many(self._cache, self.autocompleter,
+                                        [list(prefix) for prefix in prefixes],
+                                        limit)
+
+    def autocomplete_fuzzy(self, prefix: str, max_edits: int,
+                           limit: Optional[int] = None) \
+            -> List[Tuple[str, float]]:
+        """Return up to <limit> matches for the given prefix string, allowing
+        up to <max_edits> typos (a letter inserted, deleted or replaced).
+
+        The results are ordered as in autocomplete. The autocompleter must be
+        a SimplePrefixTree or CompressedPrefixTree.
+
+        Preconditions:
+            limit is None or limit > 0
+            max_edits >= 0
+            <prefix> contains only lowercase alphanumeric characters and spaces
+        """
+        return self.autocompleter.autocomplete_fuzzy(list(prefix), max_edits,
+                                                     limit)
+
+    def insert(self, text: str, weight: float = 1.0) -> None:
+        """Insert <text> with the given <weight>, sanitized the same way as the
+        lines of the input file.
+
+        Does nothing if <text> does not contain an alphanumeric character.
+        """
+        result = letter_engine_sanitizer(text)
+        if result[0].strip() != '':
+            stats = None if self._stats is None else CallStats('insert')
+            self._cache.invalidate_insert(tuple(result[1]))
+            self.autocompleter.insert(result[0], weight, result[1], stats)
+            self._version += 1
+            if stats is not None:
+                self._stats.record(stats)
 
     def remove(self, prefix: str) -> None:
         """Remove all strings that match the given prefix string.
@@ -143,7 +614,88 @@ class LetterAutocompleteEngine:
         prefix_list = []
         for char in prefix:
             prefix_list.append(char)
-        self.autocompleter.remove(prefix_list)
+        stats = None if self._stats is None else CallStats('remove')
+        self._cache.invalidate_remove(tuple(prefix_list))
+        self.autocompleter.remove(prefix_list, stats)
+        self._version += 1
+        if stats is not None:
+            self._stats.record(stats)
+
+    def remove_many(self, prefixes: List[str]) -> None:
+        """Remove all strings that match any prefix string in <prefixes>, in
+        one pass over the prefix tree.
+
+        Precondition: each prefix contains only lowercase alphanumeric
+                      characters and spaces.
+        """
+        prefix_lists = [list(prefix) for prefix in prefixes]
+        self._cache.invalidate_remove_many([tuple(prefix)
+                                            for prefix in prefix_lists])
+        self.autocompleter.remove_many(prefix_lists)
+        self._version += 1
+
+    def session(self) -> LetterSession:
+        """Return a new type-ahead session for this engine, with no text typed.
+        """
+        return LetterSession(self)
+
+    def compact(self) -> None:
+        """Finish the lazy removals that are still pending in the prefix tree,
+        if remove calls are lazy.
+        """
+        if isinstance(self.autocompleter,
+                      (SimplePrefixTree, CompressedPrefixTree)):
+            self.autocompleter.compact()
+
+    def cache_info(self) -> Dict[str, float]:
+        """Return the hits, misses, hit rate, evictions, size and maximum size
+        of this engine's result cache.
+        """
+        return self._cache.info()
+
+    def stats_info(self) -> Dict[str, Dict[str, int]]:
+        """Return, for each of insert, autocomplete and remove that was called,
+        the number of calls and the total work they did (see CallStats).
+
+        Autocomplete calls answered from the cache count no work. Returns an
+        empty dictionary if this engine was not created with the 'stats'
+        option.
+        """
+        return {} if self._stats is None else self._stats.info()
+
+    def last_stats(self) -> Optional[CallStats]:
+        """Return the work done by the most recent insert, autocomplete or
+        remove call, or None if there was none or the calls are not counted.
+        """
+        return None if self._stats is None else self._stats.last
+
+    def save(self, path: str) -> None:
+        """Write a snapshot of this engine's prefix tree to the file <path>.
+        """
+        self.autocompleter.save(path)
+
+    @classmethod
+    def load(cls, path: str, frozen: bool = False, cache_size: int = 0,
+             top_k: int = 0, stats: bool = False) -> LetterAutocompleteEngine:
+        """Return an engine using the prefix tree stored in the snapshot
+        file <path>, without reading the original text file again.
+
+        If <frozen> is True, the engine answers queries straight from the
+        memory-mapped file with a read-only FrozenPrefixTree. <cache_size>,
+        <top_k> and <stats> are the same as the config options.
+        """
+        engine = cls.__new__(cls)
+        engine._cache = ResultCache(cache_size)
+        engine._stats = EngineStats() if stats else None
+        engine._version = 0
+        if frozen:
+            engine.autocompleter = FrozenPrefixTree(path)
+        else:
+            engine.autocompleter = load_tree(path)
+            if top_k > 0 and isinstance(engine.autocompleter,
+                                        CompressedPrefixTree):
+                engine.autocompleter.set_top_k(top_k)
+        return engine
 
 
 class SentenceAutocompleteEngine:
@@ -159,8 +711,14 @@ class SentenceAutocompleteEngine:
 
     === Attributes ===
     autocompleter: An Autocompleter used by this engine.
+
+    === Private Attributes ===
+    _cache: The results of recent autocomplete calls.
+    _stats: The statistics of the calls, or None if they are not counted.
     """
     autocompleter: Autocompleter
+    _cache: ResultCache
+    _stats: Optional[EngineStats]
 
     def __init__(self, config: Dict[str, Any]) -> None:
         """Initialize this engine with the given configuration.
@@ -169,8 +727,23 @@ class SentenceAutocompleteEngine:
             - 'file': the path to a CSV file
             - 'autocompleter': either the string 'simple' or 'compressed',
               specifying which subclass of Autocompleter to use.
-            - 'weight_type': either 'sum' or 'average', which specifies the
+            - 'weight_type': 'sum', 'average' or 'max', which specifies the
               weight type for the prefix tree.
+            - 'cache_size' (optional): how many autocomplete results to
+              cache. Defaults to 0, i.e. no caching.
+            - 'top_k' (optional): for a compressed autocompleter, how many of
+              the heaviest leaves each of its trees keeps in a list, to
+              answer autocomplete calls with small limits. Defaults to 0.
+            - 'stats' (optional): if True, count the work done by each insert,
+              autocomplete and remove call (see stats_info). Defaults to
+              False.
+            - 'remove_threshold' (optional): if positive, remove calls are
+              lazy, and the prefix tree is compacted once this many are
+              pending (see compact). Defaults to 0.
+            - 'shards' (optional): if more than 1, the strings are split by
+              their first word between this many prefix trees, each held by
+              a worker process (see ShardedAutocompleter). Call close when
+              done with the engine. Defaults to 0.
 
         Precondition:
         The given file is a *CSV file* where each line has two entries:
@@ -192,19 +765,23 @@ class SentenceAutocompleteEngine:
         """
         # We haven't given you any starter code here! You should review how
         # you processed CSV files on Assignment 1.
-        if config['autocompleter'] == 'simple':
-            self.autocompleter = SimplePrefixTree(config['weight_type'])
-        elif config['autocompleter'] == 'compressed':
-            self.autocompleter = CompressedPrefixTree(config['weight_type'])
-
-        with open(config['file']) as csvfile:
-            reader = csv.reader(csvfile)
-            for line in reader:
-                final_text = sentence_engine_sanitizer(line)
-                if final_text.strip() != '':
-                    prefix = final_text.split()
-                    self.autocompleter.insert(final_text, float(line[1]),
-                                              prefix)
+        items = sentence_engine_items(config['file'])
+        if config.get('shards', 0) > 1:
+            self.autocompleter = ShardedAutocompleter(
+                config['shards'], config['autocompleter'],
+                config['weight_type'], items, config.get('top_k', 0))
+        else:
+            if config['autocompleter'] == 'simple':
+                self.autocompleter = SimplePrefixTree(config['weight_type'])
+            elif config['autocompleter'] == 'compressed':
+                self.autocompleter = CompressedPrefixTree(
+                    config['weight_type'], config.get('top_k', 0))
+            self.autocompleter.bulk_load(items)
+        self._cache = ResultCache(config.get('cache_size', 0))
+        self._stats = EngineStats() if config.get('stats', False) else None
+        if config.get('remove_threshold', 0) > 0:
+            self.autocompleter.set_removal_threshold(
+                config['remove_threshold'])
 
     def autocomplete(self, prefix: str,
                      limit: Optional[int] = None) -> List[Tuple[str, float]]:
@@ -223,7 +800,44 @@ class SentenceAutocompleteEngine:
             <prefix> contains only lowercase alphanumeric characters and spaces
         """
         prefix_list = prefix.split()
-        return self.autocompleter.autocomplete(prefix_list, limit)
+        key = tuple(prefix_list)
+        stats = None if self._stats is None else CallStats('autocomplete')
+        results = self._cache.get(key, limit)
+        if results is None:
+            results = self.autocompleter.autocomplete(prefix_list, limit,
+                                                      stats)
+            self._cache.put(key, limit, results)
+        if stats is not None:
+            self._stats.record(stats)
+        return results
+
+    def autocomplete_many(self, prefixes: List[str],
+                          limit: Optional[int] = None) \
+            -> List[List[Tuple[str, float]]]:
+        """Return autocomplete(prefix, limit) for each prefix string in
+        <prefixes>, in the same order.
+
+        The prefixes that are not cached are looked up together with
+        Autocompleter.autocomplete_many.
+        """
+        return cached_autocomplete_many(self._cache, self.autocompleter,
+                                        [prefix.split() for prefix in prefixes],
+                                        limit)
+
+    def insert(self, text: str, weight: float) -> None:
+        """Insert <text> with the given <weight>, sanitized the same way as the
+        strings in the input file.
+
+        Does nothing if <text> does not contain an alphanumeric character.
+        """
+        final_text = sentence_engine_sanitizer([text])
+        if final_text.strip() != '':
+            prefix = final_text.split()
+            stats = None if self._stats is None else CallStats('insert')
+            self._cache.invalidate_insert(tuple(prefix))
+            self.autocompleter.insert(final_text, weight, prefix, stats)
+            if stats is not None:
+                self._stats.record(stats)
 
     def remove(self, prefix: str) -> None:
         """Remove all strings that match the given prefix.
@@ -234,7 +848,94 @@ class SentenceAutocompleteEngine:
         Precondition: <prefix> contains only lowercase alphanumeric characters
                       and spaces.
         """
-        self.autocompleter.remove(prefix.split())
+        prefix_list = prefix.split()
+        stats = None if self._stats is None else CallStats('remove')
+        self._cache.invalidate_remove(tuple(prefix_list))
+        self.autocompleter.remove(prefix_list, stats)
+        if stats is not None:
+            self._stats.record(stats)
+
+    def remove_many(self, prefixes: List[str]) -> None:
+        """Remove all strings that match any prefix in <prefixes>, in one pass
+        over the prefix tree.
+
+        Precondition: each prefix contains only lowercase alphanumeric
+                      characters and spaces.
+        """
+        prefix_lists = [prefix.split() for prefix in prefixes]
+        self._cache.invalidate_remove_many([tuple(prefix)
+                                            for prefix in prefix_lists])
+        self.autocompleter.remove_many(prefix_lists)
+
+    def compact(self) -> None:
+        """Finish the lazy removals that are still pending in the prefix tree,
+        if remove calls are lazy.
+        """
+        if isinstance(self.autocompleter, (SimplePrefixTree,
+                                           CompressedPrefixTree,
+                                           ShardedAutocompleter)):
+            self.autocompleter.compact()
+
+    def close(self) -> None:
+        """Stop the worker processes of this engine, if it was created with
+        the 'shards' option.
+        """
+        if isinstance(self.autocompleter, ShardedAutocompleter):
+            self.autocompleter.close()
+
+    def cache_info(self) -> Dict[str, float]:
+        """Return the hits, misses, hit rate, evictions, size and maximum size
+        of this engine's result cache.
+        """
+        return self._cache.info()
+
+    def stats_info(self) -> Dict[str, Dict[str, int]]:
+        """Return, for each of insert, autocomplete and remove that was called,
+        the number of calls and the total work they did (see CallStats).
+
+        Autocomplete calls answered from the cache count no work. Returns an
+        empty dictionary if this engine was not created with the 'stats'
+        option.
+        """
+        return {} if self._stats is None else self._stats.info()
+
+    def last_stats(self) -> Optional[CallStats]:
+        """Return the work done by the most recent insert, autocomplete or
+        remove call, or None if there was none or the calls are not counted.
+        """
+        return None if self._stats is None else self._stats.last
+
+    def save(self, path: str) -> None:
+        """Write a snapshot of this engine's prefix tree to the file <path>.
+
+        Raise ValueError if this engine was created with the 'shards' option:
+        a snapshot holds a single prefix tree.
+        """
+        if isinstance(self.autocompleter, ShardedAutocompleter):
+            raise ValueError('cannot save a snapshot of a sharded engine')
+        self.autocompleter.save(path)
+
+    @classmethod
+    def load(cls, path: str, frozen: bool = False, cache_size: int = 0,
+             top_k: int = 0, stats: bool = False) -> SentenceAutocompleteEngine:
+        """Return an engine using the prefix tree stored in the snapshot
+        file <path>, without reading the original text file again.
+
+        If <frozen> is True, the engine answers queries straight from the
+        memory-mapped file with a read-only FrozenPrefixTree. <cache_size>,
+        <top_k> and <stats> are the same as the config options.
+        """
+        engine = cls.__new__(cls)
+        engine._cache = ResultCache(cache_size)
+        engine._stats = EngineStats() if stats else None
+        if frozen:
+            engine.autocompleter = FrozenPrefixTree(path)
+        else:
+            engine.autocompleter = load_tree(path)
+            if top_k > 0 and isinstance(engine.autocompleter,
+                                        CompressedPrefixTree):
+                engine.autocompleter.set_top_k(top_k)
+        return engine
 
 
 ################################################################################
@@ -262,7 +963,7 @@ class MelodyAutocompleteEngine:
             - 'file': the path to a CSV file
             - 'autocompleter': either the string 'simple' or 'compressed',
               specifying which subclass of Autocompleter to use.
-            - 'weight_type': either 'sum' or 'average', which specifies the
+            - 'weight_type': 'sum', 'average' or 'max', which specifies the
               weight type for the prefix tree.
 
         Precondition:
@@ -287,6 +988,7 @@ class MelodyAutocompleteEngine:
 
         with open(config['file']) as csvfile:
             reader = csv.reader(csvfile)
+            items = []
             for line in reader:
                 if line[0] != '':
                     notes = []
@@ -298,7 +1000,8 @@ class MelodyAutocompleteEngine:
                     interval_seq = []
                     for i in range(1, len(notes)):
                         interval_seq.append(notes[i][0] - notes[i - 1][0])
-                    self.autocompleter.insert(m, 1, interval_seq)
+                    items.append((m, 1, interval_seq))
+        self.autocompleter.bulk_load(items)
 
     def autocomplete(self, prefix: List[int],
                      limit: Optional[int] = None) -> List[Tuple[Melody, float]]:
@@ -314,11 +1017,24 @@ class MelodyAutocompleteEngine:
         """
         return self.autocompleter.autocomplete(prefix, limit)
 
+    def autocomplete_many(self, prefixes: List[List[int]],
+                          limit: Optional[int] = None) \
+            -> List[List[Tuple[Melody, float]]]:
+        """Return autocomplete(prefix, limit) for each interval sequence in
+        <prefixes>, in the same order.
+        """
+        return self.autocompleter.autocomplete_many(prefixes, limit)
+
     def remove(self, prefix: List[int]) -> None:
         """Remove all melodies that match the given interval sequence.
         """
         self.autocompleter.remove(prefix)
 
+    def remove_many(self, prefixes: List[List[int]]) -> None:
+        """Remove all melodies that match any interval sequence in <prefixes>.
+        """
+        self.autocompleter.remove_many(prefixes)
+
 
 ###############################################################################
 # Sample runs
@@ -359,8 +1075,11 @@ def sample_melody_autocomplete() -> None:
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(config={
-        'allowed-io': ['__init__'],
-        'extra-imports': ['csv', 'prefix_tree', 'melody']
+        'allowed-io': ['__init__', 'letter_value_chunks', 'line_ranges',
+                       'sentence_engine_items'],
+        'extra-imports': ['csv', 'mmap', 'os', 'string', 'collections',
+                          'concurrent.futures', 'prefix_tree', 'melody',
+                          'sharded_tree']
     })
 
     # This is used to increase the recursion limit so that your sample runs
@@ -0,0 +1,444 @@
+"""CSC148 Assignment 2: Autocomplete server
+
+=== Module description ===
+This file contains AutocompleteService, which answers the requests of many
+clients on one letter or sentence engine, over a TCP or Unix socket.
+
+Each request is one line of JSON, and is answered by one line of JSON, in the
+order of the requests on the connection. A request is an object with an
+'op' key, and an optional 'id' that is copied into its response:
+    - {"op": "autocomplete", "prefix": "ca", "limit": 10}
+      is answered by {"results": [["car", 3.0], ...]}
+    - {"op": "insert", "text": "cat", "weight": 1.0}
+      and {"op": "remove", "prefix": "ca"}
+      are answered by {"ok": true}
+    - {"op": "stats"} is answered by {"stats": {...}} (see
+      AutocompleteService.info)
+A request that cannot be carried out is answered by {"error": "..."}; an
+insert or remove with a malformed text, weight or prefix is rejected before
+it reaches the engine, and so is a line longer than the stream limit
+(64 KiB), which is skipped.
+
+The engine is only used from the event loop. Autocomplete requests are not
+answered one by one: those that arrive in the same loop iteration are looked
+up together with one autocomplete_many call per limit, and identical requests
+waiting at the same time are coalesced into one lookup. Inserts and removes
+are applied in order by a single writer task, after answering the requests
+that arrived before them.
+
+Run it from this directory, e.g.
+
+    python autocomplete_server.py --file data/lotr.txt --port 8148
+    python autocomplete_server.py --file data/google_searches.csv \\
+        --engine sentence --unix /tmp/autocomplete.sock
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import math
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from autocomplete_engines import LetterAutocompleteEngine, \
+    SentenceAutocompleteEngine
+
+Engine = Union[LetterAutocompleteEngine, SentenceAutocompleteEngine]
+ENGINES = {'letter': LetterAutocompleteEngine,
+           'sentence': SentenceAutocompleteEngine}
+
+
+def is_number(value: Any, types: Union[type, Tuple[type, ...]]) -> bool:
+    """Return whether <value> is a finite instance of <types>, not counting
+    bools, which JSON keeps apart from numbers.
+    """
+    if not isinstance(value, types) or isinstance(value, bool):
+        return False
+    try:
+        return math.isfinite(value)
+    except OverflowError:
+        # An int too large for a float.
+        return False
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[bytes]:
+    """Return the next line read from <reader>, or b'' at the end of the
+    stream.
+
+    Return None if the line is longer than the limit of <reader>, after
+    skipping the whole line.
+    """
+    try:
+        return await reader.readuntil(b'\n')
+    except asyncio.IncompleteReadError as error:
+        # The last line has no newline.
+        return error.partial
+    except asyncio.LimitOverrunError as error:
+        consumed = error.consumed
+    while True:
+        await reader.readexactly(consumed)
+        try:
+            await reader.readuntil(b'\n')
+            return None
+        except asyncio.IncompleteReadError:
+            return None
+        except asyncio.LimitOverrunError as error:
+            consumed = error.consumed
+
+
+class LatencyHistogram:
+    """The latencies of a kind of request, counted in buckets whose bounds are
+    powers of two microseconds.
+
+    === Attributes ===
+    count: The number of latencies recorded.
+    total: The sum of the latencies recorded, in seconds.
+    buckets:
+        buckets[i] is the number of latencies of less than 2 ** i
+        microseconds (and at least 2 ** (i - 1), for i > 0).
+    """
+    count: int
+    total: float
+    buckets: List[int]
+
+    def __init__(self) -> None:
+        """Initialize a histogram with no latencies recorded.
+        """
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * 32
+
+    def record(self, seconds: float) -> None:
+        """Record a latency of <seconds>.
+        """
+        self.count += 1
+        self.total += seconds
+        i = min(int(seconds * 1e6).bit_length(), len(self.buckets) - 1)
+        self.buckets[i] += 1
+
+    def percentile(self, p: float) -> int:
+        """Return the upper bound in microseconds of the bucket holding the
+        <p>th percentile of the latencies, or 0 if there are none.
+        """
+        rank = self.count * p / 100
+        seen = 0
+        for i in range(len(self.buckets)):
+            seen += self.buckets[i]
+            if seen > 0 and seen >= rank:
+                return 2 ** i
+        return 0
+
+    def info(self) -> Dict[str, Any]:
+        """Return the count, mean, p50, p90 and p99 of the latencies in
+        microseconds, and the count of each non-empty bucket.
+        """
+        return {'count': self.count,
+                'mean_us': self.total * 1e6 / max(self.count, 1),
+                'p50_us': self.percentile(50),
+                'p90_us': self.percentile(90),
+                'p99_us': self.percentile(99),
+                'buckets': {f'<{2 ** i}us': n
+                            for i, n in enumerate(self.buckets) if n > 0}}
+
+
+class AutocompleteService:
+    """A server for the requests of many clients on one engine.
+
+    === Attributes ===
+    engine: The engine the requests are carried out on.
+    lookups: The number of autocomplete lookups made on the engine.
+    coalesced:
+        The number of autocomplete requests answered by the lookup of an
+        identical request.
+    latencies:
+        The latency histogram of each op, from reading a request to writing
+        its response.
+
+    === Private Attributes ===
+    _pending:
+        Maps the (prefix, limit) of each autocomplete request waiting for a
+        lookup to the future of its encoded results.
+    _flush_scheduled: Whether a lookup of the pending requests is scheduled.
+    _unapplied: The number of inserts and removes not applied yet.
+    _writes:
+        The inserts and removes waiting for the writer task, each with the
+        autocomplete requests that arrived before it.
+    _writer: The writer task, once the service is started.
+    """
+    engine: Engine
+    lookups: int
+    coalesced: int
+    latencies: Dict[str, LatencyHistogram]
+    _pending: Dict[Tuple[str, Optional[int]], asyncio.Future]
+    _flush_scheduled: bool
+    _unapplied: int
+    _writes: Optional[asyncio.Queue]
+    _writer: Optional[asyncio.Task]
+
+    def __init__(self, engine: Engine) -> None:
+        """Initialize a service for <engine>.
+        """
+        self.engine = engine
+        self.lookups = 0
+        self.coalesced = 0
+        self.latencies = {}
+        self._pending = {}
+        self._flush_scheduled = False
+        self._unapplied = 0
+        self._writes = None
+        self._writer = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0,
+                    path: Optional[str] = None) -> asyncio.AbstractServer:
+        """Start the writer task, and return a server listening on the Unix
+        socket <path>, or on <host> and <port> if <path> is None.
+        """
+        self._writes = asyncio.Queue()
+        self._writer = asyncio.create_task(self._write_loop())
+        if path is not None:
+            return await asyncio.start_unix_server(self._handle, path)
+        return await asyncio.start_server(self._handle, host, port)
+
+    async def stop(self) -> None:
+        """Stop the writer task, once the writes waiting for it are done.
+        """
+        await self._writes.put(None)
+        await self._writer
+
+    def info(self) -> Dict[str, Any]:
+        """Return the number of lookups and coalesced requests, and the latency
+        histogram of each op (see LatencyHistogram.info).
+        """
+        return {'lookups': self.lookups,
+                'coalesced': self.coalesced,
+                'latencies': {op: histogram.info()
+                              for op, histogram in self.latencies.items()}}
+
+    async def _handle(self, reader: asyncio.StreamReader,
+                      writer: asyncio.StreamWriter) -> None:
+        """Answer the requests read from one connection, in order.
+
+        Requests are read without waiting for the responses of the earlier
+        ones.
+        """
+        replies = asyncio.Queue()
+        sender = asyncio.create_task(self._send_loop(replies, writer))
+        try:
+            while True:
+                line = await read_request(reader)
+                if line is None:
+                    replies.put_nowait(self._reject(
+                        ValueError('request line too long')))
+                elif line == b'':
+                    break
+                elif line.strip():
+                    replies.put_nowait(self._submit(line))
+        except ConnectionError:
+            pass
+        replies.put_nowait(None)
+        await sender
+        writer.close()
+
+    async def _send_loop(self, replies: asyncio.Queue,
+                         writer: asyncio.StreamWriter) -> None:
+        """Write the response of each (op, id, start, future) in <replies>, in
+        order, until it gets None.
+        """
+        while True:
+            reply = await replies.get()
+            if reply is None:
+                break
+            op, request_id, start, future = reply
+            body = await future
+            if request_id is None:
+                writer.write(f'{{{body}}}\n'.encode())
+            else:
+                writer.write(f'{{"id": {json.dumps(request_id)}, '
+                             f'{body}}}\n'.encode())
+            if op not in self.latencies:
+                self.latencies[op] = LatencyHistogram()
+            self.latencies[op].record(time.perf_counter() - start)
+            if replies.empty():
+                try:
+                    await writer.drain()
+                except ConnectionError:
+                    pass
+
+    def _submit(self, line: bytes) -> Tuple[str, Any, float, asyncio.Future]:
+        """Return (op, id, start, future) for the request <line>, where the
+        future is done with the body of its response.
+        """
+        start = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            op = request['op']
+            if op == 'autocomplete':
+                prefix, limit = request['prefix'], request.get('limit')
+                if not isinstance(prefix, str):
+                    raise TypeError('prefix must be a string')
+                if limit is not None and (not is_number(limit, int)
+                                          or limit <= 0):
+                    raise ValueError('limit must be a positive integer')
+                return op, request_id, start, self._lookup(prefix, limit)
+            elif op == 'insert':
+                text, weight = request['text'], request.get('weight', 1.0)
+                if not isinstance(text, str):
+                    raise TypeError('text must be a string')
+                if not is_number(weight, (int, float)) or not weight > 0:
+                    raise ValueError('weight must be a positive number')
+                self._write(op, (text, weight), future)
+            elif op == 'remove':
+                prefix = request['prefix']
+                if not isinstance(prefix, str):
+                    raise TypeError('prefix must be a string')
+                self._write(op, (prefix,), future)
+            elif op == 'stats':
+                future.set_result(f'"stats": {json.dumps(self.info())}')
+            else:
+                raise ValueError(f'unknown op {op!r}')
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            op = 'error'
+            future.set_result(f'"error": {json.dumps(repr(error))}')
+        return op, request_id, start, future
+
+    def _reject(self, error: Exception) \
+            -> Tuple[str, Any, float, asyncio.Future]:
+        """Return (op, id, start, future) for a request that could not be
+        read, where the future is done with <error> as its response.
+        """
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(f'"error": {json.dumps(repr(error))}')
+        return 'error', None, time.perf_counter(), future
+
+    def _lookup(self, prefix: str, limit: Optional[int]) -> asyncio.Future:
+        """Return the future of the encoded results of autocomplete(<prefix>,
+        <limit>), shared with the identical requests already waiting.
+        """
+        key = (prefix, limit)
+        if key in self._pending:
+            self.coalesced += 1
+            return self._pending[key]
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._flush)
+        return future
+
+    def _write(self, op: str, args: Tuple, future: asyncio.Future) -> None:
+        """Queue the write <op> on <args> for the writer task, which sets
+        <future> once it is applied.
+
+        The pending autocomplete requests are answered before the write, and
+        the later ones after it.
+        """
+        self._unapplied += 1
+        self._writes.put_nowait((op, args, future, self._pending))
+        self._pending = {}
+
+    def _flush(self) -> None:
+        """Look up the pending autocomplete requests, unless they have to wait
+        for a write.
+        """
+        self._flush_scheduled = False
+        if self._unapplied == 0:
+            pending, self._pending = self._pending, {}
+            self._answer(pending)
+
+    def _answer(self, pending: Dict[Tuple[str, Optional[int]],
+                                    asyncio.Future]) -> None:
+        """Look up the autocomplete requests in <pending>, with one
+        autocomplete_many call per limit.
+        """
+        by_limit = {}
+        for prefix, limit in pending:
+            by_limit.setdefault(limit, []).append(prefix)
+        for limit, prefixes in by_limit.items():
+            self.lookups += len(prefixes)
+            try:
+                found = self.engine.autocomplete_many(prefixes, limit)
+            except Exception as error:
+                body = f'"error": {json.dumps(repr(error))}'
+                found = None
+            for i in range(len(prefixes)):
+                if found is not None:
+                    body = f'"results": {json.dumps(found[i])}'
+                pending[(prefixes[i], limit)].set_result(body)
+
+    async def _write_loop(self) -> None:
+        """Apply the inserts and removes in the write queue, one at a time,
+        until it gets None.
+
+        The autocomplete requests that arrived before a write are answered
+        before it is applied, and those that arrived after the last write
+        once it is applied.
+        """
+        while True:
+            write = await self._writes.get()
+            if write is None:
+                break
+            op, args, future, pending = write
+            self._answer(pending)
+            try:
+                if op == 'insert':
+                    self.engine.insert(*args)
+                else:
+                    self.engine.remove(*args)
+                future.set_result('"ok": true')
+            except Exception as error:
+                future.set_result(f'"error": {json.dumps(repr(error))}')
+            self._unapplied -= 1
+            if self._unapplied == 0:
+                self._flush()
+
+
+async def serve(engine: Engine, host: str = '127.0.0.1', port: int = 0,
+                path: Optional[str] = None) -> None:
+    """Serve requests on <engine> forever, on the Unix socket <path>, or on
+    <host> and <port> if <path> is None.
+    """
+    service = AutocompleteService(engine)
+    server = await service.start(host, port, path)
+    async with server:
+        await server.serve_forever()
+
+
+def run_server(kind: str, config: Dict[str, Any], host: str = '127.0.0.1',
+               port: int = 0, path: Optional[str] = None) -> None:
+    """Build an engine of <kind> ('letter' or 'sentence') with <config>, and
+    serve requests on it forever (see serve).
+    """
+    engine = ENGINES[kind](config)
+    asyncio.run(serve(engine, host, port, path))
+
+
+def main() -> None:
+    """Run the server with the options given on the command line.
+    """
+    parser = argparse.ArgumentParser(
+        description='Serve autocomplete requests on a socket.')
+    parser.add_argument('--file', default='data/lotr.txt')
+    parser.add_argument('--engine', default='letter', choices=list(ENGINES))
+    parser.add_argument('--autocompleter', default='compressed',
+                        choices=['simple', 'compressed'])
+    parser.add_argument('--weight-type', default='sum',
+                        choices=['sum', 'average', 'max'])
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--cache-size', type=int, default=0)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8148)
+    parser.add_argument('--unix')
+    args = parser.parse_args()
+    run_server(args.engine, {'file': args.file,
+                             'autocompleter': args.autocompleter,
+                             'weight_type': args.weight_type,
+                             'top_k': args.top_k,
+                             'cache_size': args.cache_size},
+               args.host, args.port, args.unix)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,810 @@
+"""CSC148 Assignment 2: Benchmarks
+
+=== Module description ===
+This file measures the memory used by the autocomplete engines, and what
+their optional speed-ups cost and gain.
+
+Run it from this directory, e.g.
+
+    python benchmark.py memory --autocompleter simple
+    python benchmark.py top_k --top-k 10
+    python benchmark.py many --file data/google_searches.csv
+    python benchmark.py remove_many --blocklist 10000
+    python benchmark.py updates --file data/google_searches.csv --batch 1000
+    python benchmark.py ingest --file data/lotr.txt
+    python benchmark.py parallel --scale 100 --workers 1 2 4 8
+    python benchmark.py sharded --file data/google_searches.csv --shards 1 2 4
+    python benchmark.py server --queries 200000 --connections 8 --batch 100
+    python benchmark.py threads --threads 1 2 4 --seconds 2
+    python benchmark.py suite --output run.json --baseline old.json
+
+The memory benchmark reports the memory allocated while building the letter
+engine on data/lotr.txt, and how many bytes that is per stored value. The
+top_k benchmark compares a compressed letter engine with and without per-tree
+top lists: the extra memory, and the time of autocomplete calls with a limit
+of --top-k. The many benchmark compares a loop of autocomplete calls on a
+sentence engine with one autocomplete_many call, for every word prefix of
+every string in the CSV file. The remove_many benchmark removes --blocklist
+prefixes of values in the letter index of --file from a prefix tree with one
+remove_many call, and compares it with a loop of remove calls and with
+rebuilding the tree from the values the blocklist keeps. The updates
+benchmark builds a prefix tree from the CSV file --file, replays a log of
+--updates of its lines, drawn at random, as weight updates in micro-batches of
+--batch, and compares inserting the updates one by one with one apply_updates
+call per batch. The ingest benchmark reads the letter engine records of --file
+line by line through letter_engine_sanitizer, and with letter_engine_records,
+and reports the throughput of each, best of --repeat runs with the cycle
+collector off (as the engine reads them). The parallel benchmark writes
+--scale copies of --file to a temporary file, and times building a letter
+engine on it with each number of --workers processes. The sharded benchmark
+is a load test of sentence engines on the CSV file --file split into each
+number of --shards worker processes (1 being a plain engine): it sends
+--queries random word prefixes, one in 20 of them empty, and reports the p50
+and p99 latency of autocomplete calls with a limit of --limit, and the
+throughput of autocomplete_many calls on batches of --batch prefixes. The
+server benchmark starts autocomplete_server on --file (a letter engine, or a
+sentence engine for a CSV file) in another process, and sends it --queries
+random prefixes with a limit of --limit from --connections connections, each
+keeping up to --batch requests in flight; a compressed tree keeps top lists of
+--limit leaves. It reports the throughput, and the
+server's latency histogram and coalesced requests. The threads benchmark
+builds a simple prefix tree on --file, and runs each number of --threads
+reader threads, making autocomplete calls with a limit of --limit, next to one
+writer thread inserting values of --file again, for --seconds. It compares a
+PersistentPrefixTree, whose readers take no lock, with a SimplePrefixTree
+behind one lock, and reports the reads and writes per second.
+
+The suite benchmark runs both prefix tree classes with the 'sum' and 'average'
+weight types on every data set in DATASETS and on synthetic data sets of
+--sizes random values. For each run it records the insert throughput, the
+bulk_load build time, the memory the built tree holds, and the p50, p95 and
+p99 latency of autocomplete calls with a limit of --limit, each timing being
+the best of --repeat runs. The results are printed (or written to --output)
+as JSON. Given a --baseline file from an earlier run, it also reports every
+measurement that got worse by more than --tolerance, and every run of the
+baseline that is missing, and exits with status 1 if there is any.
+"""
+import argparse
+import asyncio
+import csv
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Tuple
+
+from autocomplete_engines import LetterAutocompleteEngine, \
+    SentenceAutocompleteEngine, letter_engine_records, \
+    letter_engine_sanitizer, sentence_engine_items
+from autocomplete_server import run_server
+from prefix_tree import Autocompleter, SimplePrefixTree, CompressedPrefixTree, \
+    PersistentPrefixTree, paused_gc
+
+# The data sets the suite runs on, and how each one is read.
+DATASETS = {
+    'data/lotr.txt': 'letter',
+    'data/google_no_swears.txt': 'letter',
+    'data/google_searches.csv': 'sentence',
+    'data/random_melodies_c_scale.csv': 'melody'
+}
+TREES = {'simple': SimplePrefixTree, 'compressed': CompressedPrefixTree}
+
+# For each measurement in a suite result, whether bigger is better.
+MEASUREMENTS = {
+    'insert_per_s': True,
+    'build_s': False,
+    'memory_bytes': False,
+    'p50_us': False,
+    'p95_us': False,
+    'p99_us': False
+}
+
+Item = Tuple[Any, float, List]
+
+
+def build_engine(file: str, autocompleter: str, weight_type: str,
+                 top_k: int = 0) -> Tuple[LetterAutocompleteEngine, int]:
+    """Build a letter engine on <file>, and return it with the number of bytes
+    it holds.
+    """
+    tracemalloc.start()
+    engine = LetterAutocompleteEngine({
+        'file': file,
+        'autocompleter': autocompleter,
+        'weight_type': weight_type,
+        'top_k': top_k
+    })
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return engine, current
+
+
+def measure_memory(file: str, autocompleter: str, weight_type: str) -> None:
+    """Build a letter engine on <file> and print how much memory it holds.
+    """
+    engine, current = build_engine(file, autocompleter, weight_type)
+    n = len(engine.autocompleter)
+    print(f'{autocompleter} tree on {file}: {n} values')
+    print(f'  memory: {current / 1e6:.1f} MB')
+    print(f'  per value: {current / max(n, 1):.0f} bytes')
+
+
+def query_prefixes(engine: LetterAutocompleteEngine) -> List[str]:
+    """Return the prefixes of length 1 to 3 of the values in <engine>.
+    """
+    prefixes = set()
+    for value, _ in engine.autocomplete(''):
+        for n in range(1, 4):
+            prefixes.add(value[:n])
+    return sorted(prefixes)
+
+
+def time_queries(engine: LetterAutocompleteEngine, prefixes: List[str],
+                 limit: int) -> float:
+    """Return the mean time in seconds of autocomplete(prefix, <limit>) over
+    <prefixes>.
+    """
+    start = time.perf_counter()
+    for prefix in prefixes:
+        engine.autocomplete(prefix, limit)
+    return (time.perf_counter() - start) / len(prefixes)
+
+
+def measure_top_k(file: str, weight_type: str, top_k: int) -> None:
+    """Compare compressed letter engines on <file> with and without top lists
+    of <top_k> leaves.
+    """
+    plain, plain_bytes = build_engine(file, 'compressed', weight_type)
+    listed, listed_bytes = build_engine(file, 'compressed', weight_type, top_k)
+    prefixes = query_prefixes(plain)
+    plain_time = time_queries(plain, prefixes, top_k)
+    listed_time = time_queries(listed, prefixes, top_k)
+    print(f'compressed tree on {file}, {len(prefixes)} prefixes, '
+          f'limit {top_k}')
+    print(f'  without top lists: {plain_bytes / 1e6:.1f} MB, '
+          f'{plain_time * 1e6:.1f} us per query')
+    print(f'  with top lists:    {listed_bytes / 1e6:.1f} MB, '
+          f'{listed_time * 1e6:.1f} us per query')
+
+
+def measure_many(file: str, autocompleter: str, weight_type: str,
+                 limit: int) -> None:
+    """Compare a loop of autocomplete calls with one autocomplete_many call on
+    a sentence engine built from the CSV file <file>.
+    """
+    engine = SentenceAutocompleteEngine({
+        'file': file,
+        'autocompleter': autocompleter,
+        'weight_type': weight_type
+    })
+    prefixes = []
+    for _, _, words in sentence_engine_items(file):
+        for n in range(1, len(words) + 1):
+            prefixes.append(' '.join(words[:n]))
+    start = time.perf_counter()
+    looped = [engine.autocomplete(prefix, limit) for prefix in prefixes]
+    loop_time = time.perf_counter() - start
+    start = time.perf_counter()
+    batched = engine.autocomplete_many(prefixes, limit)
+    batch_time = time.perf_counter() - start
+    assert [len(r) for r in batched] == [len(r) for r in looped]
+    print(f'{autocompleter} tree on {file}, {len(prefixes)} prefixes, '
+          f'limit {limit}')
+    print(f'  autocomplete loop:  {loop_time * 1e3:.1f} ms')
+    print(f'  autocomplete_many:  {batch_time * 1e3:.1f} ms')
+
+
+def measure_remove_many(file: str, autocompleter: str, weight_type: str,
+                        blocklist: int, seed: int) -> None:
+    """Compare removing <blocklist> prefixes from a letter index of <file>
+    with one remove_many call, with a loop of remove calls, and with a rebuild.
+    """
+    items = read_items(file, 'letter')
+    rng = random.Random(seed)
+    blocked = set()
+    for _ in range(blocklist):
+        prefix = rng.choice(items)[2]
+        blocked.add(tuple(prefix[:rng.randint(3, max(len(prefix), 3))]))
+    prefixes = [list(prefix) for prefix in blocked]
+
+    def build() -> Autocompleter:
+        tree = TREES[autocompleter](weight_type)
+        tree.bulk_load(items)
+        return tree
+
+    looped = build()
+    batched = build()
+    stale = build()
+    # As in timeit, the cycle collector is off while timing: it would walk
+    # the whole tree at random points of each step.
+    with paused_gc():
+        start = time.perf_counter()
+        for prefix in prefixes:
+            looped.remove(prefix)
+        loop_time = time.perf_counter() - start
+        start = time.perf_counter()
+        batched.remove_many(prefixes)
+        batch_time = time.perf_counter() - start
+        start = time.perf_counter()
+        kept = [item for item in items
+                if not any(tuple(item[2][:n]) in blocked
+                           for n in range(len(item[2]) + 1))]
+        rebuilt = TREES[autocompleter](weight_type)
+        rebuilt.bulk_load(kept)
+        # Freeing the removed trees is part of every way of removing them.
+        del stale
+        rebuild_time = time.perf_counter() - start
+    assert len(batched) == len(looped) == len(rebuilt)
+    print(f'{autocompleter} tree on {file}, {len(prefixes)} prefixes, '
+          f'{len(batched)} of {len(items)} values left')
+    print(f'  remove loop:  {loop_time * 1e3:.1f} ms')
+    print(f'  remove_many:  {batch_time * 1e3:.1f} ms')
+    print(f'  rebuild:      {rebuild_time * 1e3:.1f} ms')
+
+
+def measure_updates(file: str, autocompleter: str, weight_type: str,
+                    updates: int, batch: int, seed: int) -> None:
+    """Compare inserting the <updates> weight updates of a log replayed from
+    the CSV file <file> one by one with applying them in batches of <batch>.
+    """
+    items = read_items(file, 'sentence')
+    log = random.Random(seed).choices(items, k=updates)
+    batches = [log[i:i + batch] for i in range(0, len(log), batch)]
+    inserted = TREES[autocompleter](weight_type)
+    inserted.bulk_load(items)
+    applied = TREES[autocompleter](weight_type)
+    applied.bulk_load(items)
+    with paused_gc():
+        start = time.perf_counter()
+        for updates in batches:
+            for value, delta, prefix in updates:
+                inserted.insert(value, delta, prefix)
+        insert_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for updates in batches:
+            applied.apply_updates(updates)
+        apply_time = time.perf_counter() - start
+    # Values of equal weight may be in either order.
+    assert [weight for _, weight in inserted.autocomplete([])] == \
+        [weight for _, weight in applied.autocomplete([])]
+    print(f'{autocompleter} tree on {file}, {len(log)} updates in batches '
+          f'of {batch}')
+    print(f'  insert:         {len(log) / insert_time:,.0f} updates/s')
+    print(f'  apply_updates:  {len(log) / apply_time:,.0f} updates/s')
+
+
+def measure_ingest(file: str, repeat: int) -> None:
+    """Compare reading the letter engine records of <file> line by line with
+    reading them with letter_engine_records.
+    """
+    def by_line() -> List[Tuple[str, List[str]]]:
+        records = []
+        with open(file, encoding='utf8') as f:
+            for line in f:
+                value, prefix = letter_engine_sanitizer(line)
+                if value.strip() != '':
+                    records.append((value, prefix))
+        return records
+
+    def streamed() -> List[Tuple[str, List[str]]]:
+        return list(letter_engine_records(file))
+
+    size = os.path.getsize(file)
+    print(f'{file}: {size / 1e6:.1f} MB')
+    times = []
+    for name, read in [('line by line', by_line), ('streamed', streamed)]:
+        best = float('inf')
+        for _ in range(repeat):
+            with paused_gc():
+                start = time.perf_counter()
+                records = read()
+                best = min(best, time.perf_counter() - start)
+        times.append(best)
+        print(f'  {name + ":":14}{best * 1e3:7.1f} ms, '
+              f'{size / best / 1e6:6.1f} MB/s, {len(records)} records')
+    print(f'  speed-up:     {times[0] / times[1]:.1f}x')
+    assert by_line() == streamed()
+
+
+def measure_parallel(file: str, autocompleter: str, weight_type: str,
+                     scale: int, workers: List[int]) -> None:
+    """Time building letter engines on <scale> copies of <file> with each
+    number of processes in <workers>.
+    """
+    with open(file, 'rb') as f:
+        text = f.read()
+    if not text.endswith(b'\n'):
+        text += b'\n'
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = os.path.join(tmp, 'corpus.txt')
+        with open(corpus, 'wb') as f:
+            for _ in range(scale):
+                f.write(text)
+        print(f'{autocompleter} tree on {scale} copies of {file} '
+              f'({len(text) * scale / 1e6:.0f} MB), '
+              f'{os.cpu_count()} CPUs')
+        base = None
+        for n in workers:
+            start = time.perf_counter()
+            engine = LetterAutocompleteEngine({
+                'file': corpus,
+                'autocompleter': autocompleter,
+                'weight_type': weight_type,
+                'workers': n
+            })
+            build_time = time.perf_counter() - start
+            base = build_time if base is None else base
+            print(f'  {n} workers: {build_time:6.2f} s, '
+                  f'{base / build_time:.1f}x, '
+                  f'{len(engine.autocompleter)} values')
+
+
+def measure_sharded(file: str, autocompleter: str, weight_type: str,
+                    shards: List[int], queries: int, limit: int, batch: int,
+                    seed: int) -> None:
+    """Load test sentence engines built from the CSV file <file>, split into
+    each number of shards in <shards>.
+    """
+    prefixes = [' '.join(prefix) for prefix in
+                sample_prefixes(sentence_engine_items(file), queries, seed)]
+    prefixes[::20] = [''] * len(prefixes[::20])
+    print(f'{autocompleter} tree on {file}, {queries} queries, '
+          f'limit {limit}, {os.cpu_count()} CPUs')
+    for n in shards:
+        engine = SentenceAutocompleteEngine({
+            'file': file,
+            'autocompleter': autocompleter,
+            'weight_type': weight_type,
+            'shards': n
+        })
+        try:
+            times = []
+            for prefix in prefixes:
+                start = time.perf_counter()
+                engine.autocomplete(prefix, limit)
+                times.append(time.perf_counter() - start)
+            times.sort()
+            start = time.perf_counter()
+            for i in range(0, len(prefixes), batch):
+                engine.autocomplete_many(prefixes[i:i + batch], limit)
+            batch_time = time.perf_counter() - start
+        finally:
+            engine.close()
+        print(f'  {n} shards: p50 {percentile(times, 50) * 1e6:.0f} us, '
+              f'p99 {percentile(times, 99) * 1e6:.0f} us, '
+              f'{len(prefixes) / sum(times):.0f} calls/s, '
+              f'{len(prefixes) / batch_time:.0f} batched queries/s')
+
+
+async def send_queries(path: str, prefixes: List[str], limit: int,
+                       window: int) -> None:
+    """Send autocomplete requests for <prefixes> on one connection to the
+    server on the Unix socket <path>, with up to <window> of them in flight.
+    """
+    reader, writer = await asyncio.open_unix_connection(path)
+    for i in range(0, len(prefixes), window):
+        chunk = prefixes[i:i + window]
+        writer.write(b''.join(json.dumps({'op': 'autocomplete',
+                                          'prefix': prefix,
+                                          'limit': limit}).encode() + b'\n'
+                              for prefix in chunk))
+        await writer.drain()
+        for _ in chunk:
+            await reader.readline()
+    writer.close()
+    await writer.wait_closed()
+
+
+async def load_test(path: str, prefixes: List[str], limit: int,
+                    connections: int, window: int) -> Dict[str, Any]:
+    """Send <prefixes> to the server on the Unix socket <path> from
+    <connections> connections, and return the time it took and the server's
+    statistics.
+    """
+    start = time.perf_counter()
+    await asyncio.gather(*[send_queries(path, prefixes[i::connections],
+                                        limit, window)
+                           for i in range(connections)])
+    elapsed = time.perf_counter() - start
+    reader, writer = await asyncio.open_unix_connection(path)
+    writer.write(b'{"op": "stats"}\n')
+    stats = json.loads(await reader.readline())['stats']
+    writer.close()
+    await writer.wait_closed()
+    return {'elapsed': elapsed, 'stats': stats}
+
+
+def measure_server(file: str, autocompleter: str, weight_type: str,
+                   queries: int, limit: int, connections: int, window: int,
+                   seed: int) -> None:
+    """Load test an autocomplete server on <file> from another process.
+    """
+    kind = 'sentence' if file.endswith('.csv') else 'letter'
+    separator = ' ' if kind == 'sentence' else ''
+    prefixes = [separator.join(prefix) for prefix in
+                sample_prefixes(read_items(file, kind), queries, seed)]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'server.sock')
+        server = multiprocessing.Process(target=run_server, args=(
+            kind, {'file': file, 'autocompleter': autocompleter,
+                   'weight_type': weight_type, 'top_k': limit}),
+            kwargs={'path': path},
+            daemon=True)
+        server.start()
+        while not os.path.exists(path):
+            time.sleep(0.05)
+        try:
+            result = asyncio.run(load_test(path, prefixes, limit,
+                                           connections, window))
+        finally:
+            server.terminate()
+            server.join()
+    stats = result['stats']
+    latency = stats['latencies']['autocomplete']
+    print(f'{autocompleter} {kind} engine on {file}, {queries} queries, '
+          f'limit {limit}, {connections} connections x {window} in flight')
+    print(f'  throughput: {queries / result["elapsed"]:.0f} requests/s')
+    print(f'  lookups: {stats["lookups"]}, coalesced: {stats["coalesced"]}')
+    print(f'  latency: p50 <{latency["p50_us"]} us, '
+          f'p90 <{latency["p90_us"]} us, p99 <{latency["p99_us"]} us')
+    for bucket, n in latency['buckets'].items():
+        print(f'    {bucket:>10}: {n}')
+
+
+def run_threads(tree: Autocompleter, lock: Optional[threading.Lock],
+                items: List[Item], prefixes: List[List], limit: int,
+                readers: int, seconds: float) -> Tuple[int, int]:
+    """Run <readers> threads querying <prefixes> on <tree>, and one thread
+    inserting <items> into it, for <seconds>, and return the number of reads
+    and writes made. If <lock> is given, every call is made holding it.
+    """
+    stop = threading.Event()
+    counts = [0] * (readers + 1)
+
+    def read(n: int) -> None:
+        i = n
+        while not stop.is_set():
+            prefix = prefixes[i % len(prefixes)]
+            if lock is None:
+                tree.autocomplete(prefix, limit)
+            else:
+                with lock:
+                    tree.autocomplete(prefix, limit)
+            i += 1
+        counts[n] = i - n
+
+    def write() -> None:
+        i = 0
+        while not stop.is_set():
+            value, _, prefix = items[i % len(items)]
+            if lock is None:
+                tree.insert(value, 1.0, prefix)
+            else:
+                with lock:
+                    tree.insert(value, 1.0, prefix)
+            i += 1
+        counts[readers] = i
+
+    threads = [threading.Thread(target=read, args=(n,))
+               for n in range(readers)]
+    threads.append(threading.Thread(target=write))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(counts[:readers]), counts[readers]
+
+
+def measure_threads(file: str, weight_type: str, threads: List[int],
+                    queries: int, limit: int, seconds: float,
+                    seed: int) -> None:
+    """Compare mixed reads and writes from threads on a PersistentPrefixTree
+    and on a locked SimplePrefixTree built from <file>.
+    """
+    kind = 'sentence' if file.endswith('.csv') else 'letter'
+    items = read_items(file, kind)
+    prefixes = sample_prefixes(items, queries, seed)
+    writes = items[:]
+    random.Random(seed).shuffle(writes)
+    print(f'simple tree on {file}, limit {limit}, {seconds} s per run, '
+          f'{os.cpu_count()} CPUs')
+    for name in ['locked', 'persistent']:
+        for readers in threads:
+            if name == 'locked':
+                tree, lock = SimplePrefixTree(weight_type), threading.Lock()
+            else:
+                tree, lock = PersistentPrefixTree(weight_type), None
+            tree.bulk_load(items)
+            # The tree was built with the collector off: let it see the new
+            # objects once now, rather than in the middle of the run.
+            gc.collect()
+            reads, written = run_threads(tree, lock, writes, prefixes, limit,
+                                         readers, seconds)
+            print(f'  {name:>10}, {readers} readers: '
+                  f'{reads / seconds:8.0f} reads/s, '
+                  f'{written / seconds:6.0f} writes/s')
+
+
+def read_items(file: str, kind: str) -> List[Item]:
+    """Return the (value, weight, prefix) items that an engine of type <kind>
+    would insert for <file>.
+
+    Melodies are stored by name, with their interval sequence as the prefix.
+    """
+    if kind == 'letter':
+        return [(value, 1.0, prefix)
+                for value, prefix in letter_engine_records(file)]
+    if kind == 'sentence':
+        return sentence_engine_items(file)
+    items = []
+    with open(file) as csvfile:
+        for line in csv.reader(csvfile):
+            if line[0] != '':
+                pitches = [int(pitch) for pitch in line[1:-1:2]]
+                intervals = [pitches[i] - pitches[i - 1]
+                             for i in range(1, len(pitches))]
+                items.append((line[0], 1.0, intervals))
+    return items
+
+
+def synthetic_items(size: int, seed: int) -> List[Item]:
+    """Return <size> random lowercase words of 3 to 12 letters as letter
+    items, with weights drawn from a Zipf-like distribution.
+
+    The same <size> and <seed> always give the same items.
+    """
+    rng = random.Random(seed)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    items = []
+    for _ in range(size):
+        prefix = rng.choices(letters, k=rng.randint(3, 12))
+        items.append((''.join(prefix), float(int(1 / rng.random())), prefix))
+    return items
+
+
+def sample_prefixes(items: List[Item], queries: int, seed: int) -> List[List]:
+    """Return <queries> prefixes of 1 to 3 elements of the prefixes in
+    <items>, chosen at random with <seed>.
+    """
+    rng = random.Random(seed)
+    prefixes = []
+    for _ in range(queries):
+        prefix = rng.choice(items)[2]
+        prefixes.append(prefix[:rng.randint(1, 3)])
+    return prefixes
+
+
+def percentile(times: List[float], p: float) -> float:
+    """Return the <p>th percentile of the sorted, non-empty list <times>,
+    using the nearest rank.
+    """
+    return times[min(len(times) - 1, int(len(times) * p / 100))]
+
+
+def run_case(name: str, items: List[Item], autocompleter: str,
+             weight_type: str, prefixes: List[List], limit: int,
+             repeat: int) -> Dict[str, Any]:
+    """Measure a tree of type <autocompleter> with <weight_type> on <items>,
+    querying <prefixes>, and return the results for the data set <name>.
+
+    Every timing is the best of <repeat> runs, to keep noise out of the
+    comparison with a baseline.
+    """
+    tree_class = TREES[autocompleter]
+    insert_time = build_time = float('inf')
+    times = [float('inf')] * len(prefixes)
+    for _ in range(repeat):
+        tree = tree_class(weight_type)
+        start = time.perf_counter()
+        for value, weight, prefix in items:
+            tree.insert(value, weight, prefix)
+        insert_time = min(insert_time, time.perf_counter() - start)
+
+        tree = tree_class(weight_type)
+        start = time.perf_counter()
+        tree.bulk_load(items)
+        build_time = min(build_time, time.perf_counter() - start)
+        times = [min(old, new) for old, new
+                 in zip(times, query_times(tree, prefixes, limit))]
+    times.sort()
+
+    tracemalloc.start()
+    measured = tree_class(weight_type)
+    measured.bulk_load(items)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'dataset': name,
+        'autocompleter': autocompleter,
+        'weight_type': weight_type,
+        'values': len(measured),
+        'insert_per_s': len(items) / max(insert_time, 1e-9),
+        'build_s': build_time,
+        'memory_bytes': memory,
+        'queries': len(prefixes),
+        'p50_us': percentile(times, 50) * 1e6,
+        'p95_us': percentile(times, 95) * 1e6,
+        'p99_us': percentile(times, 99) * 1e6
+    }
+
+
+def query_times(tree: Autocompleter, prefixes: List[List],
+                limit: int) -> List[float]:
+    """Return the time in seconds of autocomplete(prefix, <limit>) on <tree>
+    for each prefix in <prefixes>, in the same order.
+    """
+    times = []
+    clock = time.perf_counter
+    for prefix in prefixes:
+        start = clock()
+        tree.autocomplete(prefix, limit)
+        times.append(clock() - start)
+    return times
+
+
+def run_suite(sizes: List[int], queries: int, limit: int, seed: int,
+              repeat: int) -> Dict[str, Any]:
+    """Run the suite on every data set in DATASETS and on synthetic data sets
+    of each size in <sizes>, and return its results.
+    """
+    datasets = [(file, read_items(file, kind))
+                for file, kind in DATASETS.items()]
+    for size in sizes:
+        datasets.append((f'synthetic-{size}', synthetic_items(size, seed)))
+    results = []
+    for name, items in datasets:
+        prefixes = sample_prefixes(items, queries, seed)
+        for autocompleter in TREES:
+            for weight_type in ['sum', 'average']:
+                result = run_case(name, items, autocompleter, weight_type,
+                                  prefixes, limit, repeat)
+                print(f'{name} {autocompleter} {weight_type}: '
+                      f'{result["build_s"]:.2f} s build, '
+                      f'{result["p50_us"]:.1f} us p50', file=sys.stderr)
+                results.append(result)
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'limit': limit,
+        'seed': seed,
+        'repeat': repeat,
+        'results': results
+    }
+
+
+def regressions(baseline: Dict[str, Any], current: Dict[str, Any],
+                tolerance: float) -> List[str]:
+    """Return a description of each measurement in <current> that is worse
+    than the same one in <baseline> by more than the fraction <tolerance>.
+
+    Runs are matched by data set, autocompleter and weight type. A run of
+    <baseline> that is missing from <current> is reported too, so that a
+    benchmark that stopped running does not pass; new runs are ignored.
+    """
+    def case(result: Dict[str, Any]) -> Tuple[str, str, str]:
+        return (result['dataset'], result['autocompleter'],
+                result['weight_type'])
+
+    old = {case(result): result for result in baseline['results']}
+    ran = {case(result) for result in current['results']}
+    found = [f'{" ".join(key)}: missing' for key in old if key not in ran]
+    for result in current['results']:
+        if case(result) not in old:
+            continue
+        for measurement, bigger_is_better in MEASUREMENTS.items():
+            before = old[case(result)][measurement]
+            after = result[measurement]
+            if bigger_is_better:
+                worse = after < before * (1 - tolerance)
+            else:
+                worse = after > before * (1 + tolerance)
+            if worse:
+                found.append(f'{" ".join(case(result))} {measurement}: '
+                             f'{before:.4g} -> {after:.4g}')
+    return found
+
+
+def measure_suite(sizes: List[int], queries: int, limit: int, seed: int,
+                  repeat: int, output: Optional[str], baseline: Optional[str],
+                  tolerance: float) -> int:
+    """Run the suite, write its JSON results to <output> (or print them), and
+    return 1 if any measurement regressed from the <baseline> file, else 0.
+    """
+    report = run_suite(sizes, queries, limit, seed, repeat)
+    text = json.dumps(report, indent=2)
+    if output is None:
+        print(text)
+    else:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+    if baseline is None:
+        return 0
+    with open(baseline) as f:
+        found = regressions(json.load(f), report, tolerance)
+    for line in found:
+        print(f'regression: {line}', file=sys.stderr)
+    return 1 if found else 0
+
+
+def main() -> None:
+    """Parse the command line and run the chosen benchmark.
+    """
+    parser = argparse.ArgumentParser(
+        description='Benchmark the autocomplete engines.')
+    parser.add_argument('benchmark', choices=['memory', 'top_k', 'many',
+                                              'remove_many', 'updates',
+                                              'ingest', 'parallel', 'sharded',
+                                              'server', 'threads',
+                                              'suite'])
+    parser.add_argument('--file', default='data/lotr.txt')
+    parser.add_argument('--autocompleter', default='simple',
+                        choices=['simple', 'compressed'])
+    parser.add_argument('--weight-type', default='sum',
+                        choices=['sum', 'average', 'max'])
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--blocklist', type=int, default=10000)
+    parser.add_argument('--updates', type=int, default=100000)
+    parser.add_argument('--batch', type=int, default=1000)
+    parser.add_argument('--scale', type=int, default=100)
+    parser.add_argument('--workers', type=int, nargs='*', default=[1, 2, 4])
+    parser.add_argument('--shards', type=int, nargs='*', default=[1, 2, 4])
+    parser.add_argument('--connections', type=int, default=8)
+    parser.add_argument('--threads', type=int, nargs='*', default=[1, 2, 4])
+    parser.add_argument('--seconds', type=float, default=2.0)
+    parser.add_argument('--sizes', type=int, nargs='*',
+                        default=[10000, 100000],
+                        help='synthetic data set sizes, e.g. up to 10000000')
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=148)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output')
+    parser.add_argument('--baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+    if args.benchmark == 'memory':
+        measure_memory(args.file, args.autocompleter, args.weight_type)
+    elif args.benchmark == 'top_k':
+        measure_top_k(args.file, args.weight_type, args.top_k)
+    elif args.benchmark == 'many':
+        measure_many(args.file, args.autocompleter, args.weight_type,
+                     args.limit)
+    elif args.benchmark == 'remove_many':
+        measure_remove_many(args.file, args.autocompleter, args.weight_type,
+                            args.blocklist, args.seed)
+    elif args.benchmark == 'updates':
+        measure_updates(args.file, args.autocompleter, args.weight_type,
+                        args.updates, args.batch, args.seed)
+    elif args.benchmark == 'ingest':
+        measure_ingest(args.file, args.repeat)
+    elif args.benchmark == 'parallel':
+        measure_parallel(args.file, args.autocompleter, args.weight_type,
+                         args.scale, args.workers)
+    elif args.benchmark == 'sharded':
+        measure_sharded(args.file, args.autocompleter, args.weight_type,
+                        args.shards, args.queries, args.limit, args.batch,
+                        args.seed)
+    elif args.benchmark == 'server':
+        measure_server(args.file, args.autocompleter, args.weight_type,
+                       args.queries, args.limit, args.connections, args.batch,
+                       args.seed)
+    elif args.benchmark == 'threads':
+        measure_threads(args.file, args.weight_type, args.threads,
+                        args.queries, args.limit, args.seconds, args.seed)
+    elif args.benchmark == 'suite':
+        sys.exit(measure_suite(args.sizes, args.queries, args.limit,
+                               args.seed, args.repeat, args.output,
+                               args.baseline, args.tolerance))
+
+
+if __name__ == '__main__':
+    main()
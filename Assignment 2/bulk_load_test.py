@@ -0,0 +1,85 @@
+import unittest
+from prefix_tree import SimplePrefixTree, CompressedPrefixTree
+
+
+def repr_tree(t):
+    if t.is_empty():
+        return ''
+    template = "Tree({} ({})"
+    subtrees = ', '.join([repr_tree(s) for s in t.subtrees])
+    if subtrees:
+        subtrees = ' [' + subtrees + ']'
+    return template.format(t.value, float(t.weight)) + subtrees + ')'
+
+
+ITEMS = [('car', 100.0, ['c', 'a', 'r']),
+         ('door', 4.0, ['d', 'o', 'o', 'r']),
+         ('danger', 6.0, ['d', 'a', 'n', 'g', 'e', 'r']),
+         ('cat', 20.0, ['c', 'a', 't']),
+         ('care', 30.0, ['c', 'a', 'r', 'e'])]
+
+
+class BulkLoadTest(unittest.TestCase):
+
+    def test_empty_items(self):
+        tree = SimplePrefixTree('sum')
+        tree.bulk_load([])
+        self.assertEqual(repr_tree(tree), '')
+        self.assertEqual(len(tree), 0)
+
+    def test_simple_same_as_insert(self):
+        for weight_type in ['sum', 'average']:
+            inserted = SimplePrefixTree(weight_type)
+            for value, weight, prefix in ITEMS:
+                inserted.insert(value, weight, prefix)
+            loaded = SimplePrefixTree(weight_type)
+            loaded.bulk_load(ITEMS)
+            self.assertEqual(repr_tree(loaded), repr_tree(inserted))
+            self.assertEqual(len(loaded), 5)
+
+    def test_compressed_same_as_insert(self):
+        for weight_type in ['sum', 'average']:
+            inserted = CompressedPrefixTree(weight_type)
+            for value, weight, prefix in ITEMS:
+                inserted.insert(value, weight, prefix)
+            loaded = CompressedPrefixTree(weight_type)
+            loaded.bulk_load(ITEMS)
+            self.assertEqual(repr_tree(loaded), repr_tree(inserted))
+            self.assertEqual(len(loaded), 5)
+
+    def test_duplicate_values_add_weights(self):
+        tree = SimplePrefixTree('sum')
+        tree.bulk_load([('Gary', 5, ['a']), ('Gary', 5, ['a'])])
+        expected = "Tree([] (10.0) [Tree(['a'] (10.0) [Tree(Gary (10.0))])])"
+        self.assertEqual(repr_tree(tree), expected)
+
+    def test_unhashable_values(self):
+        for tree_class in [SimplePrefixTree, CompressedPrefixTree]:
+            items = [([i % 12], 1.0, ['a']) for i in range(24)]
+            inserted = tree_class('sum')
+            for value, weight, prefix in items:
+                inserted.insert(value, weight, prefix)
+            loaded = tree_class('sum')
+            loaded.bulk_load(items + [('b', 1.0, ['b'])])
+            inserted.insert('b', 1.0, ['b'])
+            self.assertEqual(repr_tree(loaded), repr_tree(inserted))
+            self.assertEqual(len(loaded), 13)
+
+    def test_compressed_root_takes_common_prefix(self):
+        tree = CompressedPrefixTree('sum')
+        tree.bulk_load([('Alice', 4.0, ['a', 'b']),
+                        ('Bob', 3.0, ['a', 'b', 'c', 'd'])])
+        expected = "Tree(['a', 'b'] (7.0) [Tree(Alice (4.0)), " \
+                   "Tree(['a', 'b', 'c', 'd'] (3.0) [Tree(Bob (3.0))])])"
+        self.assertEqual(repr_tree(tree), expected)
+
+    def test_load_into_non_empty_tree(self):
+        tree = CompressedPrefixTree('sum')
+        tree.insert('car', 100.0, ['c', 'a', 'r'])
+        tree.bulk_load(ITEMS[1:])
+        self.assertEqual(len(tree), 5)
+        self.assertEqual(tree.autocomplete(['c'], 1), [('car', 100.0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
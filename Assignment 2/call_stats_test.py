@@ -0,0 +1,117 @@
+import os
+import tempfile
+import unittest
+from prefix_tree import SimplePrefixTree, CompressedPrefixTree, CallStats
+from autocomplete_engines import LetterAutocompleteEngine
+from tree_test_helpers import fill, ITEMS
+
+
+class CallStatsTest(unittest.TestCase):
+
+    def test_insert(self):
+        tree = fill(SimplePrefixTree('sum'), ITEMS[:4])
+        stats = CallStats('insert')
+        tree.insert('care', 30.0, ['c', 'a', 'r', 'e'], stats)
+        self.assertEqual(stats.info(), {'calls': 1, 'nodes': 5, 'leaves': 1,
+                                        'slices': 1, 'comparisons': 3})
+        stats = CallStats('insert')
+        tree.insert('cat', 200.0, ['c', 'a', 't'], stats)
+        self.assertEqual((stats.nodes, stats.leaves), (4, 0))
+
+    def test_autocomplete(self):
+        tree = fill(SimplePrefixTree('sum'), ITEMS[:4])
+        stats = CallStats('autocomplete')
+        self.assertEqual(tree.autocomplete(['c'], 2, stats),
+                         [('car', 100.0), ('cat', 20.0)])
+        # The path to ['c'], then the trees taken off the search queue.
+        self.assertEqual(stats.nodes, 2 + 6)
+        self.assertEqual((stats.leaves, stats.comparisons), (2, 1))
+        missing = CallStats('autocomplete')
+        self.assertEqual(tree.autocomplete(['x'], None, missing), [])
+        self.assertEqual((missing.nodes, missing.leaves), (1, 0))
+
+    def test_compressed_top_list_slice(self):
+        tree = fill(CompressedPrefixTree('sum', 2), ITEMS[:4])
+        stats = CallStats('autocomplete')
+        self.assertEqual(tree.autocomplete(['c', 'a'], 1, stats),
+                         [('car', 100.0)])
+        self.assertEqual(stats.info(), {'calls': 1, 'nodes': 2, 'leaves': 1,
+                                        'slices': 1, 'comparisons': 0})
+
+    def test_remove(self):
+        for tree in [fill(SimplePrefixTree('sum'), ITEMS[:4]),
+                     fill(CompressedPrefixTree('sum'), ITEMS[:4])]:
+            stats = CallStats('remove')
+            tree.remove(['d'], stats)
+            self.assertEqual(stats.info(), {'calls': 1, 'nodes': 2,
+                                            'leaves': 2, 'slices': 0,
+                                            'comparisons': 1})
+            self.assertEqual(len(tree), 2)
+
+    def test_remove_counts_sort_comparisons(self):
+        tree = SimplePrefixTree('sum')
+        for value, weight in [('a', 4.0), ('b', 3.0), ('c', 2.0),
+                              ('d', 1.0)]:
+            tree.insert(value, weight, [value])
+        stats = CallStats('remove')
+        tree.remove(['b'], stats)
+        # The sort of [a, b, c, d] with b emptied: a run of two, then c and
+        # d placed by binary insertion.
+        self.assertEqual(stats.comparisons, 6)
+        self.assertEqual(tree.autocomplete([]), [('a', 4.0), ('c', 2.0),
+                                                 ('d', 1.0)])
+
+    def test_add(self):
+        total = CallStats('insert')
+        other = CallStats('insert')
+        other.nodes = 3
+        total.add(other)
+        self.assertEqual((total.calls, total.nodes), (2, 3))
+
+    def test_same_results_without_stats(self):
+        tree = fill(CompressedPrefixTree('average'), ITEMS[:4])
+        self.assertEqual(tree.autocomplete(['c'], None, CallStats('x')),
+                         tree.autocomplete(['c']))
+
+
+class EngineStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.file = os.path.join(self.dir.name, 'lines.txt')
+        with open(self.file, 'w') as f:
+            f.write('car\ncar\ncat\ndoor\n')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_aggregates(self):
+        engine = LetterAutocompleteEngine({'file': self.file,
+                                           'autocompleter': 'simple',
+                                           'weight_type': 'sum',
+                                           'cache_size': 10,
+                                           'stats': True})
+        engine.autocomplete('ca')
+        first = engine.last_stats()
+        self.assertEqual(first.leaves, 2)
+        engine.autocomplete('ca')
+        self.assertEqual(engine.last_stats().nodes, 0)
+        engine.insert('cab')
+        engine.remove('d')
+        info = engine.stats_info()
+        self.assertEqual(info['autocomplete']['calls'], 2)
+        self.assertEqual(info['autocomplete']['nodes'], first.nodes)
+        self.assertEqual(info['insert']['leaves'], 1)
+        self.assertEqual(info['remove']['leaves'], 1)
+
+    def test_disabled(self):
+        engine = LetterAutocompleteEngine({'file': self.file,
+                                           'autocompleter': 'compressed',
+                                           'weight_type': 'sum'})
+        engine.autocomplete('ca')
+        self.assertEqual(engine.stats_info(), {})
+        self.assertIsNone(engine.last_stats())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -121,5 +121,67 @@ class CompressedAutoCompleteTest(unittest.TestCase):
         self.assertEqual(tree.autocomplete(['c'], 4), expected)
 
 
+    def test_limit_returns_heaviest_leaves(self):
+        self.sum_tree.insert('cat', 2, ['c', 'a', 't'])
+        self.sum_tree.insert('car', 3, ['c', 'a', 'r'])
+        self.sum_tree.insert('dog', 4, ['d', 'o', 'g'])
+        expected = [('dog', 4.0), ('car', 3.0)]
+        self.assertEqual(self.sum_tree.autocomplete([], 2), expected)
+
+    def test_top_lists(self):
+        tree = CompressedPrefixTree('average', 2)
+        tree.insert('car', 100.0, ['c', 'a', 'r'])
+        tree.insert('door', 4.0, ['d', 'o', 'o', 'r'])
+        tree.insert('danger', 6.0, ['d', 'a', 'n', 'g', 'e', 'r'])
+        tree.insert('cat', 20.0, ['c', 'a', 't'])
+        tree.insert('care', 30.0, ['c', 'a', 'r', 'e'])
+        self.assertEqual(tree.autocomplete(['c'], 2),
+                         [('car', 100.0), ('care', 30.0)])
+        tree.insert('cat', 90.0, ['c', 'a', 't'])
+        self.assertEqual(tree.autocomplete([], 2),
+                         [('cat', 110.0), ('car', 100.0)])
+        tree.remove(['c', 'a', 'r'])
+        self.assertEqual(tree.autocomplete(['c', 'a'], 2), [('cat', 110.0)])
+        self.assertEqual(tree.autocomplete([], 2),
+                         [('cat', 110.0), ('danger', 6.0)])
+        self.assertEqual(len(tree.autocomplete([])), 3)
+
+    def test_top_lists_average_above_top_k(self):
+        tree = CompressedPrefixTree('average', 1)
+        tree.insert('b', 3.0, ['b'])
+        tree.insert('d', 2.5, ['d'])
+        tree.insert('ca', 8.0, ['c', 'a'])
+        for value in ['cb', 'cc', 'cd', 'ce']:
+            tree.insert(value, 0.5, list(value))
+        # 'b' and 'd' outweigh the average of 'c', but not its heaviest
+        # leaf.
+        self.assertEqual(tree.autocomplete([], 1), [('ca', 8.0)])
+        self.assertEqual(tree.autocomplete([], 2),
+                         [('ca', 8.0), ('b', 3.0)])
+        self.assertEqual(tree.autocomplete([], 3),
+                         tree.autocomplete([])[:3])
+
+    def test_autocomplete_many(self):
+        tree = CompressedPrefixTree('sum')
+        tree.insert('car', 100.0, ['c', 'a', 'r'])
+        tree.insert('door', 4.0, ['d', 'o', 'o', 'r'])
+        tree.insert('danger', 6.0, ['d', 'a', 'n', 'g', 'e', 'r'])
+        tree.insert('care', 30.0, ['c', 'a', 'r', 'e'])
+        prefixes = [['d', 'a', 'n', 'g'], ['d', 'a'], ['c'], ['d', 'a', 'x'],
+                    ['d', 'o'], []]
+        expected = [tree.autocomplete(prefix) for prefix in prefixes]
+        self.assertEqual(tree.autocomplete_many(prefixes), expected)
+
+    def test_autocomplete_fuzzy_along_edges(self):
+        tree = CompressedPrefixTree('sum')
+        tree.insert('door', 4.0, ['d', 'o', 'o', 'r'])
+        tree.insert('danger', 6.0, ['d', 'a', 'n', 'g', 'e', 'r'])
+        self.assertEqual(tree.autocomplete_fuzzy(['d', 'a', 'g', 'e'], 1),
+                         [('danger', 6.0)])
+        self.assertEqual(tree.autocomplete_fuzzy(['d', 'o', 'r'], 1),
+                         [('door', 4.0)])
+        self.assertEqual(tree.autocomplete_fuzzy(['x', 'y'], 1), [])
+        self.assertEqual(len(tree.autocomplete_fuzzy(['x', 'y'], 2)), 2)
+
 if __name__ == '__main__':
     unittest.main()
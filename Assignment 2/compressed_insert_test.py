@@ -65,6 +65,23 @@ class TestInsert(unittest.TestCase):
                    "[Tree(danger (6.0))]), Tree(['d', 'o', 'o', 'r'] (4.0) [Tree(door (4.0))])])])"
         self.assertEqual(expected, repr_tree(tree))
 
+    def test_insert_prefix_of_existing_node(self):
+        tree = CompressedPrefixTree('sum')
+        tree.insert('Alice', 2.0, ['a', 'b', 'c'])
+        tree.insert('Bob', 5.0, ['a', 'b'])
+        expected = "Tree(['a', 'b'] (7.0) [Tree(Bob (5.0)), " \
+                   "Tree(['a', 'b', 'c'] (2.0) [Tree(Alice (2.0))])])"
+        self.assertEqual(expected, repr_tree(tree))
+
+    def test_insert_unhashable_values(self):
+        tree = CompressedPrefixTree('sum')
+        for i in range(12):
+            tree.insert([i], 1.0, ['a'])
+        tree.insert([3], 20.0, ['a'])
+        self.assertEqual(len(tree), 12)
+        self.assertEqual(tree.autocomplete(['a'], 2), [([3], 21.0),
+                                                       ([0], 1.0)])
+
 
 
 
@@ -73,6 +73,16 @@ class TestInsert(unittest.TestCase):
         expected = "Tree(['a', 'b'] (2.0) [Tree(Hello (2.0))])"
         self.assertEqual(expected, repr_tree(tree))
 
+    def test_remove_max_weight(self):
+        tree = CompressedPrefixTree('max')
+        tree.insert('Hello', 2.0, ['a', 'b'])
+        tree.insert('Hey', 5.0, ['a', 'b', 'c', 'q'])
+        tree.insert('Hi', 1.0, ['a', 'b', 'c', 'r'])
+        tree.remove(['a', 'b', 'c', 'q'])
+        expected = "Tree(['a', 'b'] (2.0) [Tree(Hello (2.0)), " \
+                   "Tree(['a', 'b', 'c', 'r'] (1.0) [Tree(Hi (1.0))])])"
+        self.assertEqual(expected, repr_tree(tree))
+
 
 if __name__ == "__main__":
     unittest.main(exit=False)
\ No newline at end of file
@@ -0,0 +1,57 @@
+import unittest
+from prefix_tree import SimplePrefixTree, CompressedPrefixTree, PrefixCursor
+from tree_test_helpers import fill
+
+
+class PrefixCursorTest(unittest.TestCase):
+
+    def test_same_as_autocomplete(self):
+        for tree in [fill(SimplePrefixTree('sum')),
+                     fill(CompressedPrefixTree('sum'))]:
+            cursor = PrefixCursor(tree)
+            for element in ['d', 'a', 'n', 'x']:
+                cursor.type(element)
+                prefix = cursor.prefix
+                self.assertEqual(cursor.autocomplete(),
+                                 tree.autocomplete(prefix))
+                self.assertEqual(cursor.autocomplete(1),
+                                 tree.autocomplete(prefix, 1))
+
+    def test_inside_compressed_edge(self):
+        tree = CompressedPrefixTree('sum')
+        tree.insert('danger', 6.0, ['d', 'a', 'n', 'g', 'e', 'r'])
+        tree.insert('door', 4.0, ['d', 'o', 'o', 'r'])
+        cursor = PrefixCursor(tree)
+        for element in 'dang':
+            cursor.type(element)
+        self.assertEqual(cursor.autocomplete(), [('danger', 6.0)])
+        cursor.type('o')
+        self.assertEqual(cursor.autocomplete(), [])
+
+    def test_backspace(self):
+        tree = fill(CompressedPrefixTree('sum'))
+        cursor = PrefixCursor(tree)
+        for element in 'dox':
+            cursor.type(element)
+        self.assertEqual(cursor.autocomplete(), [])
+        cursor.backspace()
+        self.assertEqual(cursor.autocomplete(), [('door', 4.0)])
+        cursor.backspace()
+        cursor.backspace()
+        cursor.backspace()
+        self.assertEqual(cursor.prefix, [])
+        self.assertEqual(len(cursor.autocomplete()), 5)
+
+    def test_refresh_after_split(self):
+        tree = fill(CompressedPrefixTree('sum'))
+        cursor = PrefixCursor(tree)
+        for element in 'dan':
+            cursor.type(element)
+        tree.insert('dance', 1.0, ['d', 'a', 'n', 'c', 'e'])
+        cursor.refresh()
+        self.assertEqual(cursor.autocomplete(),
+                         [('danger', 6.0), ('dance', 1.0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import tempfile
+import unittest
+import autocomplete_engines
+from autocomplete_engines import letter_engine_records, \
+    letter_engine_sanitizer
+
+
+TEXT = 'Hello, World!\r\nÉCOLE d’été\n\n --- \rLine 3\tend\nlast line'
+
+
+class LetterEngineRecordsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.file = os.path.join(self.dir.name, 'lines.txt')
+        with open(self.file, 'w', encoding='utf8', newline='') as f:
+            f.write(TEXT)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def expected(self):
+        records = []
+        with open(self.file, encoding='utf8') as f:
+            for line in f:
+                value, prefix = letter_engine_sanitizer(line)
+                if value.strip() != '':
+                    records.append((value, prefix))
+        return records
+
+    def test_same_as_sanitizer(self):
+        records = list(letter_engine_records(self.file))
+        self.assertEqual(records, self.expected())
+        self.assertEqual([value for value, _ in records],
+                         ['hello world', 'école dété', 'line 3end',
+                          'last line'])
+
+    def test_small_chunks(self):
+        size = autocomplete_engines.CHUNK_SIZE
+        try:
+            for chunk_size in [1, 2, 5]:
+                autocomplete_engines.CHUNK_SIZE = chunk_size
+                self.assertEqual(list(letter_engine_records(self.file)),
+                                 self.expected())
+        finally:
+            autocomplete_engines.CHUNK_SIZE = size
+
+    def test_empty_file(self):
+        empty = os.path.join(self.dir.name, 'empty.txt')
+        open(empty, 'w').close()
+        self.assertEqual(list(letter_engine_records(empty)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
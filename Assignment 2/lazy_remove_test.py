@@ -0,0 +1,93 @@
+import os
+import tempfile
+import unittest
+from prefix_tree import SimplePrefixTree, CompressedPrefixTree
+from autocomplete_engines import LetterAutocompleteEngine
+from tree_test_helpers import repr_tree, fill
+
+
+class LazyRemoveTest(unittest.TestCase):
+
+    def test_queries_skip_removed_values(self):
+        for tree_class in [SimplePrefixTree, CompressedPrefixTree]:
+            tree = fill(tree_class('sum'))
+            tree.set_removal_threshold(100)
+            tree.remove(['c', 'a', 'r'])
+            self.assertEqual(tree.autocomplete([]),
+                             [('cat', 20.0), ('danger', 6.0), ('door', 4.0)])
+            self.assertEqual(tree.autocomplete(['c', 'a', 'r']), [])
+            self.assertEqual(tree.autocomplete(['c', 'a', 'r', 'e']), [])
+            self.assertEqual(len(tree), 3)
+            self.assertEqual(tree.weight, 30.0)
+
+    def test_compact_same_as_eager_remove(self):
+        for tree_class in [SimplePrefixTree, CompressedPrefixTree]:
+            eager = fill(tree_class('average'))
+            lazy = fill(tree_class('average'))
+            lazy.set_removal_threshold(100)
+            for prefix in [['c', 'a', 'r'], ['d', 'o']]:
+                eager.remove(prefix)
+                lazy.remove(prefix)
+            lazy.compact()
+            self.assertEqual(repr_tree(lazy), repr_tree(eager))
+
+    def test_threshold_compacts(self):
+        tree = fill(CompressedPrefixTree('sum'))
+        tree.set_removal_threshold(2)
+        tree.remove(['d', 'o'])
+        self.assertEqual(len(tree.subtrees[1].subtrees), 2)
+        tree.remove(['c', 'a', 't'])
+        # Compacted: 'danger' is the only value left under ['d'].
+        expected = "Tree(['c', 'a', 'r'] (130.0) [Tree(car (100.0)), " \
+                   "Tree(['c', 'a', 'r', 'e'] (30.0) [Tree(care (30.0))])])"
+        self.assertEqual(repr_tree(tree.subtrees[0]), expected)
+        self.assertEqual(repr_tree(tree.subtrees[1]),
+                         "Tree(['d', 'a', 'n', 'g', 'e', 'r'] (6.0) "
+                         "[Tree(danger (6.0))])")
+
+    def test_insert_into_removed_subtree(self):
+        tree = fill(CompressedPrefixTree('sum', 2))
+        tree.set_removal_threshold(100)
+        tree.remove(['d'])
+        tree.insert('dog', 5.0, ['d', 'o', 'g'])
+        self.assertEqual(tree.autocomplete(['d']), [('dog', 5.0)])
+        self.assertEqual(tree.autocomplete(['d'], 1), [('dog', 5.0)])
+        tree.compact()
+        self.assertEqual(repr_tree(tree.subtrees[1]),
+                         "Tree(['d', 'o', 'g'] (5.0) [Tree(dog (5.0))])")
+
+    def test_turn_off(self):
+        tree = fill(SimplePrefixTree('sum'))
+        tree.set_removal_threshold(100)
+        tree.remove(['d'])
+        tree.set_removal_threshold(0)
+        self.assertEqual(len(tree.subtrees), 1)
+        tree.remove(['c', 'a', 't'])
+        self.assertEqual(len(tree), 2)
+
+
+class LazyRemoveEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.file = os.path.join(self.dir.name, 'lines.txt')
+        with open(self.file, 'w') as f:
+            f.write('car\ncar\ncat\ndoor\n')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_engine(self):
+        engine = LetterAutocompleteEngine({'file': self.file,
+                                           'autocompleter': 'compressed',
+                                           'weight_type': 'sum',
+                                           'remove_threshold': 10})
+        engine.remove('car')
+        self.assertEqual(engine.autocomplete(''), [('cat', 1.0),
+                                                   ('door', 1.0)])
+        engine.compact()
+        self.assertEqual(engine.autocomplete('c'), [('cat', 1.0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
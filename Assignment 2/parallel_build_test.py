@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+from collections import Counter
+from autocomplete_engines import LetterAutocompleteEngine, line_ranges, \
+    count_letter_values
+
+
+TEXT = 'Car\ncat\n\ndoor!\ncar\nCare\ndog\ncat\ncar'
+
+
+class ParallelBuildTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.file = os.path.join(self.dir.name, 'lines.txt')
+        with open(self.file, 'w') as f:
+            f.write(TEXT)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_line_ranges(self):
+        size = os.path.getsize(self.file)
+        for parts in [1, 2, 3, 5, 100]:
+            ranges = line_ranges(self.file, parts)
+            self.assertEqual(ranges[0][0], 0)
+            self.assertEqual(ranges[-1][1], size)
+            with open(self.file, 'rb') as f:
+                text = f.read()
+            for start, end in ranges:
+                self.assertLess(start, end)
+                self.assertTrue(start == 0 or text[start - 1:start] == b'\n')
+            for (_, end), (start, _) in zip(ranges, ranges[1:]):
+                self.assertEqual(end, start)
+
+    def test_count_ranges(self):
+        total = count_letter_values(self.file)
+        self.assertEqual(total, Counter({'car': 3, 'cat': 2, 'door': 1,
+                                         'care': 1, 'dog': 1}))
+        for parts in [2, 3, 5]:
+            counts = Counter()
+            for start, end in line_ranges(self.file, parts):
+                counts.update(count_letter_values(self.file, start, end))
+            self.assertEqual(counts, total)
+
+    def test_engine_workers(self):
+        for autocompleter in ['simple', 'compressed']:
+            engines = [LetterAutocompleteEngine({
+                'file': self.file,
+                'autocompleter': autocompleter,
+                'weight_type': 'sum',
+                'workers': workers
+            }) for workers in [0, 2]]
+            for prefix in ['', 'c', 'ca', 'd', 'x']:
+                self.assertEqual(engines[1].autocomplete(prefix),
+                                 engines[0].autocomplete(prefix))
+            self.assertEqual(engines[1].autocomplete('ca', 2),
+                             [('car', 3.0), ('cat', 2.0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import threading
+import unittest
+from prefix_tree import SimplePrefixTree, PersistentPrefixTree
+from tree_test_helpers import repr_tree, fill
+
+
+class PersistentPrefixTreeTest(unittest.TestCase):
+
+    def test_same_as_simple(self):
+        for weight_type in ['sum', 'average', 'max']:
+            simple = fill(SimplePrefixTree(weight_type))
+            persistent = fill(PersistentPrefixTree(weight_type))
+            self.assertEqual(repr_tree(persistent.root), repr_tree(simple))
+            for tree in [simple, persistent]:
+                tree.remove(['d', 'o'])
+                tree.apply_updates([('cat', 90.0, ['c', 'a', 't']),
+                                    ('dog', 1.0, ['d', 'o', 'g'])])
+                tree.remove_many([['c', 'a', 'r', 'e'], ['x']])
+            self.assertEqual(repr_tree(persistent.root), repr_tree(simple))
+            self.assertEqual(len(persistent), 4)
+            self.assertEqual(persistent.autocomplete(['c'], 1),
+                             simple.autocomplete(['c'], 1))
+
+    def test_versions_unchanged(self):
+        tree = fill(PersistentPrefixTree('sum'))
+        old = tree.root
+        before = repr_tree(old)
+        tree.insert('cab', 500.0, ['c', 'a', 'b'])
+        tree.remove(['d'])
+        self.assertEqual(repr_tree(old), before)
+        self.assertEqual(old.autocomplete([], 1), [('car', 100.0)])
+        self.assertEqual(tree.autocomplete([], 1), [('cab', 500.0)])
+        tree.remove([])
+        self.assertTrue(tree.root.is_empty())
+        self.assertEqual(repr_tree(old), before)
+
+    def test_shares_unchanged_trees(self):
+        tree = fill(PersistentPrefixTree('sum'))
+        old = tree.root
+        tree.insert('dog', 1.0, ['d', 'o', 'g'])
+        old_c = old.find_child('c')
+        self.assertIs(tree.root.find_child('c'), old_c)
+        self.assertIsNot(tree.root.find_child('d'), old.find_child('d'))
+
+    def test_bulk_load(self):
+        tree = PersistentPrefixTree('sum')
+        tree.bulk_load([('cat', 2.0, ['c', 'a', 't'])])
+        tree.bulk_load([('cat', 1.0, ['c', 'a', 't']),
+                        ('car', 1.0, ['c', 'a', 'r'])])
+        self.assertEqual(tree.autocomplete(['c']), [('cat', 3.0),
+                                                    ('car', 1.0)])
+
+    def test_threads(self):
+        tree = PersistentPrefixTree('sum')
+        words = [a + b + c for a in 'abcd' for b in 'abcd' for c in 'abcd']
+        done = threading.Event()
+        errors = []
+
+        def read():
+            while not done.is_set():
+                root = tree.root
+                results = root.autocomplete([], None)
+                weights = [weight for _, weight in results]
+                if weights != sorted(weights, reverse=True) or \
+                        sum(weights) != root.weight:
+                    errors.append(results)
+
+        readers = [threading.Thread(target=read) for _ in range(3)]
+        for reader in readers:
+            reader.start()
+        for i in range(300):
+            word = words[(i * 7) % len(words)]
+            tree.insert(word, float(i % 5 + 1), list(word))
+            if i % 50 == 49:
+                tree.remove([word[0]])
+        done.set()
+        for reader in readers:
+            reader.join()
+        self.assertEqual(errors, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
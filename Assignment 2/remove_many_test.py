@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+from prefix_tree import SimplePrefixTree, CompressedPrefixTree
+from autocomplete_engines import LetterAutocompleteEngine, ResultCache
+from tree_test_helpers import repr_tree, fill
+
+
+class RemoveManyTest(unittest.TestCase):
+
+    def test_same_as_remove(self):
+        prefixes = [['d', 'o'], ['c', 'a', 'r', 'e'], ['x'], ['d', 'o', 'o']]
+        for tree_class in [SimplePrefixTree, CompressedPrefixTree]:
+            for weight_type in ['sum', 'average']:
+                one = fill(tree_class(weight_type))
+                many = fill(tree_class(weight_type))
+                for prefix in prefixes:
+                    one.remove(prefix)
+                many.remove_many(prefixes)
+                self.assertEqual(repr_tree(many), repr_tree(one))
+                self.assertEqual(len(many), 3)
+
+    def test_reorders_children(self):
+        for tree_class in [SimplePrefixTree, CompressedPrefixTree]:
+            tree = fill(tree_class('sum'))
+            tree.remove_many([['c', 'a', 'r']])
+            self.assertEqual(tree.autocomplete([]),
+                             [('cat', 20.0), ('danger', 6.0), ('door', 4.0)])
+            self.assertEqual(tree.autocomplete(['d'], 1), [('danger', 6.0)])
+
+    def test_empty_prefix(self):
+        for tree_class in [SimplePrefixTree, CompressedPrefixTree]:
+            tree = fill(tree_class('sum'))
+            tree.remove_many([['c'], []])
+            self.assertTrue(tree.is_empty())
+            self.assertEqual(len(tree), 0)
+
+    def test_all_values(self):
+        tree = fill(CompressedPrefixTree('sum', 2))
+        tree.remove_many([['c'], ['d']])
+        self.assertTrue(tree.is_empty())
+        tree.insert('dog', 5.0, ['d', 'o', 'g'])
+        self.assertEqual(tree.autocomplete([], 1), [('dog', 5.0)])
+
+
+class RemoveManyEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.file = os.path.join(self.dir.name, 'lines.txt')
+        with open(self.file, 'w') as f:
+            f.write('car\ncar\ncat\ndoor\ndog\n')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_invalidate_remove_many(self):
+        cache = ResultCache(10)
+        for prefix in [(), ('a',), ('a', 'b'), ('a', 'b', 'c'), ('b',),
+                       ('c',), ('c', 'd')]:
+            cache.put(prefix, None, [])
+        cache.invalidate_remove_many([('a', 'b'), ('c', 'd')])
+        self.assertEqual(len(cache), 1)
+        self.assertIsNotNone(cache.get(('b',), None))
+
+    def test_engine(self):
+        engine = LetterAutocompleteEngine({'file': self.file,
+                                           'autocompleter': 'compressed',
+                                           'weight_type': 'sum',
+                                           'cache_size': 10})
+        self.assertEqual(engine.autocomplete('d'), [('dog', 1.0),
+                                                    ('door', 1.0)])
+        engine.autocomplete('c')
+        engine.remove_many(['car', 'doo'])
+        self.assertEqual(engine.autocomplete(''), [('cat', 1.0),
+                                                   ('dog', 1.0)])
+        self.assertEqual(engine.autocomplete('d'), [('dog', 1.0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
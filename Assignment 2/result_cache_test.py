@@ -0,0 +1,104 @@
+import os
+import tempfile
+import unittest
+from autocomplete_engines import LetterAutocompleteEngine, \
+    SentenceAutocompleteEngine, ResultCache
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    def test_hit_and_miss(self):
+        cache = ResultCache(2)
+        self.assertIsNone(cache.get(('a',), None))
+        cache.put(('a',), None, [('ab', 1.0)])
+        self.assertEqual(cache.get(('a',), None), [('ab', 1.0)])
+        self.assertIsNone(cache.get(('a',), 1))
+        info = cache.info()
+        self.assertEqual((info['hits'], info['misses']), (1, 2))
+
+    def test_evicts_least_recently_used(self):
+        cache = ResultCache(2)
+        cache.put(('a',), None, [])
+        cache.put(('b',), None, [])
+        cache.get(('a',), None)
+        cache.put(('c',), None, [])
+        self.assertIsNone(cache.get(('b',), None))
+        self.assertEqual(cache.get(('a',), None), [])
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.info()['evictions'], 1)
+
+    def test_invalidate_insert(self):
+        cache = ResultCache(10)
+        for prefix in [(), ('a',), ('a', 'b'), ('a', 'b', 'c'), ('b',)]:
+            cache.put(prefix, None, [])
+        cache.put(('a',), 3, [])
+        cache.invalidate_insert(('a', 'b'))
+        self.assertEqual(len(cache), 2)
+        self.assertIsNotNone(cache.get(('a', 'b', 'c'), None))
+        self.assertIsNotNone(cache.get(('b',), None))
+
+    def test_invalidate_remove(self):
+        cache = ResultCache(10)
+        for prefix in [(), ('a',), ('a', 'b'), ('a', 'b', 'c'), ('b',)]:
+            cache.put(prefix, None, [])
+        cache.invalidate_remove(('a', 'b'))
+        self.assertEqual(len(cache), 1)
+        self.assertIsNotNone(cache.get(('b',), None))
+
+
+class EngineCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.file = os.path.join(self.dir.name, 'lines.txt')
+        with open(self.file, 'w') as f:
+            f.write('car\ncar\ncat\ndoor\n')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_letter_engine_insert_and_remove(self):
+        engine = LetterAutocompleteEngine({'file': self.file,
+                                           'autocompleter': 'compressed',
+                                           'weight_type': 'sum',
+                                           'cache_size': 10})
+        self.assertEqual(engine.autocomplete('ca'),
+                         [('car', 2.0), ('cat', 1.0)])
+        engine.autocomplete('d')
+        engine.insert('Cat!', 2.0)
+        self.assertEqual(engine.autocomplete('ca'),
+                         [('cat', 3.0), ('car', 2.0)])
+        engine.autocomplete('d')
+        engine.remove('car')
+        self.assertEqual(engine.autocomplete('ca'), [('cat', 3.0)])
+        info = engine.cache_info()
+        self.assertEqual(info['hits'], 1)
+        self.assertEqual(info['misses'], 4)
+
+    def test_sentence_engine_without_cache(self):
+        csv_file = os.path.join(self.dir.name, 'lines.csv')
+        with open(csv_file, 'w') as f:
+            f.write('how to cook,5\nhow are you,3\n')
+        engine = SentenceAutocompleteEngine({'file': csv_file,
+                                             'autocompleter': 'simple',
+                                             'weight_type': 'sum'})
+        self.assertEqual(engine.autocomplete('how', 1), [('how to cook', 5.0)])
+        engine.insert('How are you?', 4)
+        self.assertEqual(engine.autocomplete('how', 1), [('how are you', 7.0)])
+        self.assertEqual(engine.cache_info()['size'], 0)
+
+    def test_autocomplete_many(self):
+        engine = LetterAutocompleteEngine({'file': self.file,
+                                           'autocompleter': 'simple',
+                                           'weight_type': 'sum',
+                                           'cache_size': 10})
+        engine.autocomplete('d')
+        results = engine.autocomplete_many(['ca', 'd', 'x', 'ca'])
+        self.assertEqual(results, [[('car', 2.0), ('cat', 1.0)],
+                                   [('door', 1.0)], [],
+                                   [('car', 2.0), ('cat', 1.0)]])
+        self.assertEqual(engine.cache_info()['hits'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from autocomplete_engines import SentenceAutocompleteEngine
+from autocomplete_server import AutocompleteService, LatencyHistogram
+
+
+LINES = ['how to cook rice,10', 'how to cook pasta,6', 'how old is he,3',
+         'what is love,8', 'what time is it,4']
+
+
+class LatencyHistogramTest(unittest.TestCase):
+
+    def test_percentiles(self):
+        histogram = LatencyHistogram()
+        for seconds in [0.0000005, 0.000003, 0.000003, 0.000100]:
+            histogram.record(seconds)
+        self.assertEqual(histogram.count, 4)
+        self.assertEqual(histogram.percentile(50), 4)
+        self.assertEqual(histogram.percentile(99), 128)
+        self.assertEqual(histogram.info()['buckets'],
+                         {'<1us': 1, '<4us': 2, '<128us': 1})
+        self.assertEqual(LatencyHistogram().percentile(50), 0)
+
+
+class AutocompleteServiceTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        file = os.path.join(self.dir.name, 'lines.csv')
+        with open(file, 'w') as f:
+            f.write('\n'.join(LINES) + '\n')
+        self.service = AutocompleteService(SentenceAutocompleteEngine({
+            'file': file, 'autocompleter': 'compressed',
+            'weight_type': 'sum'}))
+        self.server = await self.service.start(
+            path=os.path.join(self.dir.name, 'server.sock'))
+        self.reader, self.writer = await asyncio.open_unix_connection(
+            os.path.join(self.dir.name, 'server.sock'))
+
+    async def asyncTearDown(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        self.server.close()
+        await self.server.wait_closed()
+        await self.service.stop()
+        self.dir.cleanup()
+
+    async def send(self, *requests):
+        for request in requests:
+            self.writer.write(json.dumps(request).encode() + b'\n')
+        await self.writer.drain()
+        return [json.loads(await self.reader.readline()) for _ in requests]
+
+    async def test_autocomplete(self):
+        replies = await self.send({'op': 'autocomplete', 'prefix': 'how',
+                                   'limit': 2, 'id': 1},
+                                  {'op': 'autocomplete', 'prefix': 'what'})
+        self.assertEqual(replies, [
+            {'id': 1, 'results': [['how to cook rice', 10.0],
+                                  ['how to cook pasta', 6.0]]},
+            {'results': [['what is love', 8.0], ['what time is it', 4.0]]}])
+
+    async def test_coalescing(self):
+        request = {'op': 'autocomplete', 'prefix': 'how', 'limit': 1}
+        replies = await self.send(*[request] * 10)
+        self.assertEqual(replies, [{'results': [['how to cook rice', 10.0]]}]
+                         * 10)
+        self.assertEqual(self.service.lookups, 1)
+        self.assertEqual(self.service.coalesced, 9)
+
+    async def test_writes_in_order(self):
+        replies = await self.send(
+            {'op': 'autocomplete', 'prefix': 'how', 'limit': 1},
+            {'op': 'insert', 'text': 'How are you', 'weight': 20.0},
+            {'op': 'autocomplete', 'prefix': 'how', 'limit': 1},
+            {'op': 'remove', 'prefix': 'how'},
+            {'op': 'autocomplete', 'prefix': 'how', 'limit': 1})
+        self.assertEqual(replies, [
+            {'results': [['how to cook rice', 10.0]]}, {'ok': True},
+            {'results': [['how are you', 20.0]]}, {'ok': True},
+            {'results': []}])
+
+    async def test_errors(self):
+        self.writer.write(b'not json\n')
+        replies = await self.send({'op': 'fly', 'id': 'a'},
+                                  {'op': 'autocomplete', 'prefix': 'how',
+                                   'limit': 0})
+        replies.append(json.loads(await self.reader.readline()))
+        self.assertEqual([sorted(reply) for reply in replies],
+                         [['error'], ['error', 'id'], ['error']])
+
+    async def test_bad_writes(self):
+        replies = await self.send(
+            {'op': 'insert', 'text': 'how now', 'weight': '5'},
+            {'op': 'insert', 'text': 'how now', 'weight': -100},
+            {'op': 'insert', 'text': 'how now', 'weight': True},
+            {'op': 'insert', 'text': 'how now', 'weight': float('inf')},
+            {'op': 'insert', 'text': 5, 'weight': 1.0},
+            {'op': 'remove', 'prefix': ['how']},
+            {'op': 'autocomplete', 'prefix': 'how', 'limit': True},
+            {'op': 'insert', 'text': 'how are you', 'weight': 1.0},
+            {'op': 'autocomplete', 'prefix': 'how'})
+        self.assertEqual([sorted(reply) for reply in replies[:7]],
+                         [['error']] * 7)
+        self.assertEqual(replies[7:], [
+            {'ok': True},
+            {'results': [['how to cook rice', 10.0],
+                         ['how to cook pasta', 6.0],
+                         ['how old is he', 3.0], ['how are you', 1.0]]}])
+
+    async def test_long_line(self):
+        self.writer.write(b'{"op": "autocomplete", "prefix": "'
+                          + b'a' * 100000 + b'"}\n')
+        replies = await self.send({'op': 'autocomplete', 'prefix': 'what',
+                                   'limit': 1})
+        replies.append(json.loads(await self.reader.readline()))
+        self.assertEqual(sorted(replies[0]), ['error'])
+        self.assertEqual(replies[1], {'results': [['what is love', 8.0]]})
+
+    async def test_stats(self):
+        await self.send({'op': 'autocomplete', 'prefix': ''})
+        stats = (await self.send({'op': 'stats'}))[0]['stats']
+        self.assertEqual(stats['lookups'], 1)
+        self.assertEqual(stats['latencies']['autocomplete']['count'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import os
+import tempfile
+import unittest
+from autocomplete_engines import LetterAutocompleteEngine
+
+
+class LetterSessionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.file = os.path.join(self.dir.name, 'lines.txt')
+        with open(self.file, 'w') as f:
+            f.write('car\ncar\ncat\ndoor\ndanger\n')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_type_and_backspace(self):
+        for kind in ['simple', 'compressed']:
+            engine = LetterAutocompleteEngine({'file': self.file,
+                                               'autocompleter': kind,
+                                               'weight_type': 'sum'})
+            session = engine.session()
+            session.type('ca')
+            self.assertEqual(session.autocomplete(),
+                             [('car', 2.0), ('cat', 1.0)])
+            session.type('tz')
+            self.assertEqual(session.autocomplete(), [])
+            session.backspace()
+            self.assertEqual(session.text, 'cat')
+            self.assertEqual(session.autocomplete(1), [('cat', 1.0)])
+
+    def test_engine_changes(self):
+        engine = LetterAutocompleteEngine({'file': self.file,
+                                           'autocompleter': 'compressed',
+                                           'weight_type': 'sum'})
+        session = engine.session()
+        session.type('da')
+        engine.insert('dance', 3.0)
+        self.assertEqual(session.autocomplete(),
+                         [('dance', 3.0), ('danger', 1.0)])
+        engine.remove('da')
+        self.assertEqual(session.autocomplete(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
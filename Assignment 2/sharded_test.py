@@ -0,0 +1,125 @@
+import os
+import tempfile
+import unittest
+from autocomplete_engines import SentenceAutocompleteEngine
+from prefix_tree import CallStats, CompressedPrefixTree
+from sharded_tree import ShardedAutocompleter, shard_of, merge_results
+
+
+LINES = ['how to cook rice,10', 'how to cook pasta,6', 'how old is he,3',
+         'what is love,8', 'what time is it,4', 'where am i,2',
+         'cook book,5', 'rice cooker,1', 'is it raining,7']
+
+
+def items():
+    result = []
+    for line in LINES:
+        text, weight = line.split(',')
+        result.append((text, float(weight), text.split()))
+    return result
+
+
+class ShardedAutocompleterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tree = ShardedAutocompleter(3, 'compressed', 'sum', items())
+        self.single = CompressedPrefixTree('sum')
+        self.single.bulk_load(items())
+
+    def tearDown(self):
+        self.tree.close()
+
+    def check_same(self):
+        self.assertEqual(len(self.tree), len(self.single))
+        for prefix in [[], ['how'], ['how', 'to'], ['what'], ['x']]:
+            for limit in [None, 1, 3]:
+                self.assertEqual(self.tree.autocomplete(prefix, limit),
+                                 self.single.autocomplete(prefix, limit))
+
+    def test_shard_of(self):
+        self.assertEqual(shard_of([], 4), 0)
+        self.assertEqual(shard_of(['how', 'to'], 4), shard_of(['how'], 4))
+        self.assertTrue(0 <= shard_of(['what'], 4) < 4)
+
+    def test_merge_results(self):
+        self.assertEqual(merge_results([[('a', 5.0), ('b', 1.0)],
+                                        [('c', 4.0), ('d', 2.0)], []], 3),
+                         [('a', 5.0), ('c', 4.0), ('d', 2.0)])
+        self.assertEqual(len(merge_results([[('a', 5.0)], [('c', 4.0)]],
+                                           None)), 2)
+
+    def test_same_as_single_tree(self):
+        self.check_same()
+
+    def test_autocomplete_many(self):
+        prefixes = [['how'], [], ['what', 'is'], ['x'], ['cook']]
+        self.assertEqual(self.tree.autocomplete_many(prefixes, 2),
+                         self.single.autocomplete_many(prefixes, 2))
+
+    def test_updates(self):
+        for tree in [self.tree, self.single]:
+            tree.insert('where to go', 20.0, ['where', 'to', 'go'])
+            tree.remove(['how', 'old'])
+            tree.remove_many([['rice'], ['what', 'time']])
+            tree.apply_updates([('cook book', 4.0, ['cook', 'book'])])
+        self.check_same()
+        self.tree.remove([])
+        self.assertEqual(len(self.tree), 0)
+        self.assertEqual(self.tree.autocomplete([]), [])
+
+    def test_stats(self):
+        stats = CallStats('autocomplete')
+        self.tree.autocomplete([], None, stats)
+        self.assertEqual(stats.calls, 1)
+        self.assertEqual(stats.leaves, len(LINES))
+
+    def test_error(self):
+        with self.assertRaises(AttributeError):
+            self.tree._scatter('no_such_method', ())
+        self.check_same()
+
+
+class ShardedEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.file = os.path.join(self.dir.name, 'lines.csv')
+        with open(self.file, 'w') as f:
+            f.write('\n'.join(LINES) + '\n')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_engine(self):
+        config = {'file': self.file, 'autocompleter': 'simple',
+                  'weight_type': 'sum', 'cache_size': 10}
+        single = SentenceAutocompleteEngine(config)
+        sharded = SentenceAutocompleteEngine(dict(config, shards=2))
+        try:
+            for prefix in ['', 'how', 'how to', 'what', 'x']:
+                self.assertEqual(sharded.autocomplete(prefix),
+                                 single.autocomplete(prefix))
+            sharded.insert('How to swim!', 30.0)
+            self.assertEqual(sharded.autocomplete('how', 1),
+                             [('how to swim', 30.0)])
+            sharded.remove('how to')
+            self.assertEqual(sharded.autocomplete('how'),
+                             [('how old is he', 3.0)])
+        finally:
+            sharded.close()
+
+    def test_save(self):
+        sharded = SentenceAutocompleteEngine({
+            'file': self.file, 'autocompleter': 'compressed',
+            'weight_type': 'sum', 'shards': 2})
+        try:
+            with self.assertRaises(ValueError):
+                sharded.save(os.path.join(self.dir.name, 'tree.snap'))
+            self.assertEqual(sharded.autocomplete('how', 1),
+                             [('how to cook rice', 10.0)])
+        finally:
+            sharded.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
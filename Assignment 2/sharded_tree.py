@@ -0,0 +1,305 @@
+"""CSC148 Assignment 2: Sharded prefix trees
+
+=== Module description ===
+This file contains ShardedAutocompleter, an Autocompleter whose values are
+split between prefix trees held by worker processes, so that the queries on
+different shards are answered by more than one core.
+
+Each value is stored in the shard given by the first element of its prefix
+sequence (see shard_of). A query with a non-empty prefix only matches values
+in one shard, and is sent to that shard alone; a query with the empty prefix
+is sent to every shard, and their results are merged.
+"""
+from __future__ import annotations
+import heapq
+import multiprocessing
+import zlib
+from itertools import islice
+from multiprocessing.connection import Connection
+from operator import itemgetter
+from typing import Any, List, Optional, Tuple
+
+from prefix_tree import Autocompleter, SimplePrefixTree, \
+    CompressedPrefixTree, CallStats, paused_gc
+
+
+def shard_of(prefix: List, shards: int) -> int:
+    """Return the shard of the values with the prefix sequence <prefix>, out
+    of <shards> shards.
+
+    The shard only depends on the first element of <prefix>, and is the same
+    in every process. Values with the empty prefix are in shard 0.
+    """
+    if not prefix:
+        return 0
+    return zlib.crc32(str(prefix[0]).encode()) % shards
+
+
+def merge_results(results: List[List[Tuple[Any, float]]],
+                  limit: Optional[int]) -> List[Tuple[Any, float]]:
+    """Return up to <limit> of the (value, weight) tuples in <results>, in
+    non-increasing order of weight.
+
+    Precondition: each list in <results> is in non-increasing order of weight.
+    """
+    merged = heapq.merge(*results, key=itemgetter(1), reverse=True)
+    return list(islice(merged, limit))
+
+
+def serve_shard(conn: Connection, autocompleter: str, weight_type: str,
+                top_k: int, items: List[Tuple[Any, float, List]]) -> None:
+    """Build a prefix tree from <items>, then answer the requests received on
+    <conn> until it receives None.
+
+    A request is a tuple (method, args, operation). The reply is a tuple
+    (result, stats, error) with the result of calling the tree's method on
+    args, the work done by the call if <operation> is not None, and the
+    exception it raised, if any.
+    """
+    if autocompleter == 'simple':
+        tree = SimplePrefixTree(weight_type)
+    else:
+        tree = CompressedPrefixTree(weight_type, top_k)
+    with paused_gc():
+        tree.bulk_load(items)
+    del items
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        method, args, operation = request
+        stats = None if operation is None else CallStats(operation)
+        try:
+            if stats is None:
+                result = getattr(tree, method)(*args)
+            else:
+                result = getattr(tree, method)(*args, stats)
+            conn.send((result, stats, None))
+        except Exception as error:
+            conn.send((None, stats, error))
+    conn.close()
+
+
+class ShardedAutocompleter(Autocompleter):
+    """An Autocompleter whose values are split between prefix trees held by
+    worker processes.
+
+    The shards are only called through the methods of this class, one
+    request at a time from the process that created it. Call close when done
+    with it.
+
+    === Attributes ===
+    shards: The number of worker processes.
+
+    === Private Attributes ===
+    _conns: The connection to each worker process, by shard.
+    _processes: The worker processes, by shard.
+    """
+    shards: int
+    _conns: List[Connection]
+    _processes: List[multiprocessing.Process]
+
+    def __init__(self, shards: int, autocompleter: str, weight_type: str,
+                 items: List[Tuple[Any, float, List]], top_k: int = 0) -> None:
+        """Start <shards> worker processes, each building a prefix tree of the
+        kind named by <autocompleter> ('simple' or 'compressed') from its
+        share of the (value, weight, prefix) tuples in <items>.
+
+        <weight_type> and <top_k> are passed to the prefix trees.
+
+        Precondition: shards > 0
+        """
+        parts = [[] for _ in range(shards)]
+        for item in items:
+            parts[shard_of(item[2], shards)].append(item)
+        self.shards = shards
+        self._conns = []
+        self._processes = []
+        for part in parts:
+            conn, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=serve_shard,
+                args=(child, autocompleter, weight_type, top_k, part),
+                daemon=True)
+            process.start()
+            child.close()
+            self._conns.append(conn)
+            self._processes.append(process)
+
+    def __len__(self) -> int:
+        """Return the number of values stored in this Autocompleter."""
+        return sum(self._scatter('__len__', ()))
+
+    def _call(self, shard: int, method: str, args: Tuple,
+              stats: Optional[CallStats] = None) -> Any:
+        """Return the result of calling <method> on <args> in <shard>, adding
+        the work it did to <stats> if it is given.
+        """
+        self._send(shard, method, args, stats)
+        return self._receive(shard, stats)
+
+    def _scatter(self, method: str, args: Tuple,
+                 stats: Optional[CallStats] = None) -> List[Any]:
+        """Return the results of calling <method> on <args> in every shard, by
+        shard, adding the work they did to <stats> if it is given.
+
+        The shards work on the call at the same time.
+        """
+        for shard in range(self.shards):
+            self._send(shard, method, args, stats)
+        return self._gather(stats)
+
+    def _send(self, shard: int, method: str, args: Tuple,
+              stats: Optional[CallStats]) -> None:
+        """Send a request to call <method> on <args> to <shard>.
+        """
+        operation = None if stats is None else stats.operation
+        self._conns[shard].send((method, args, operation))
+
+    def _receive(self, shard: int, stats: Optional[CallStats]) -> Any:
+        """Return the result of the request sent to <shard>, adding the work it
+        did to <stats> if it is given.
+
+        Raise the exception the call raised in the shard, if any.
+        """
+        result, shard_stats, error = self._conns[shard].recv()
+        if shard_stats is not None:
+            shard_stats.calls = 0
+            stats.add(shard_stats)
+        if error is not None:
+            raise error
+        return result
+
+    def _gather(self, stats: Optional[CallStats]) -> List[Any]:
+        """Return the results of the requests sent to every shard, by shard,
+        adding the work they did to <stats> if it is given.
+
+        Raise the first exception a call raised, once every shard replied.
+        """
+        replies = [conn.recv() for conn in self._conns]
+        for _, shard_stats, error in replies:
+            if shard_stats is not None:
+                shard_stats.calls = 0
+                stats.add(shard_stats)
+        for _, _, error in replies:
+            if error is not None:
+                raise error
+        return [result for result, _, _ in replies]
+
+    def insert(self, value: Any, weight: float, prefix: List,
+               stats: Optional[CallStats] = None) -> None:
+        """Insert the given value into the shard of <prefix>.
+
+        See Autocompleter.insert.
+        """
+        self._call(shard_of(prefix, self.shards), 'insert',
+                   (value, weight, prefix), stats)
+
+    def autocomplete(self, prefix: List, limit: Optional[int] = None,
+                     stats: Optional[CallStats] = None) \
+            -> List[Tuple[Any, float]]:
+        """Return up to <limit> matches for the given prefix.
+
+        A non-empty prefix is looked up in its shard only. The empty prefix is
+        looked up in every shard, and their results are merged.
+
+        See Autocompleter.autocomplete.
+        """
+        if prefix:
+            return self._call(shard_of(prefix, self.shards), 'autocomplete',
+                              (prefix, limit), stats)
+        return merge_results(self._scatter('autocomplete', (prefix, limit),
+                                           stats), limit)
+
+    def autocomplete_many(self, prefixes: List[List],
+                          limit: Optional[int] = None) \
+            -> List[List[Tuple[Any, float]]]:
+        """Return autocomplete(prefix, limit) for each prefix in <prefixes>,
+        in the same order.
+
+        Each shard is sent one request with all of its prefixes, and the
+        shards look them up at the same time.
+        """
+        batches = self._batches(prefixes)
+        for shard in range(self.shards):
+            self._send(shard, 'autocomplete_many',
+                       ([prefixes[i] for i in batches[shard]], limit), None)
+        found = [[] for _ in prefixes]
+        for batch, results in zip(batches, self._gather(None)):
+            for i, result in zip(batch, results):
+                found[i].append(result)
+        return [results[0] if len(results) == 1
+                else merge_results(results, limit) for results in found]
+
+    def remove(self, prefix: List,
+               stats: Optional[CallStats] = None) -> None:
+        """Remove all values that match the given prefix, from every shard if
+        <prefix> is empty.
+        """
+        if prefix:
+            self._call(shard_of(prefix, self.shards), 'remove', (prefix,),
+                       stats)
+        else:
+            self._scatter('remove', (prefix,), stats)
+
+    def remove_many(self, prefixes: List[List]) -> None:
+        """Remove all values that match any prefix in <prefixes>, with one
+        remove_many call in each shard.
+        """
+        batches = self._batches(prefixes)
+        for shard in range(self.shards):
+            self._send(shard, 'remove_many',
+                       ([prefixes[i] for i in batches[shard]],), None)
+        self._gather(None)
+
+    def apply_updates(self, updates: List[Tuple[Any, float, List]]) -> None:
+        """Add each (value, delta, prefix) update in <updates>, with one
+        apply_updates call in each shard.
+
+        See Autocompleter.apply_updates.
+        """
+        batches = [[] for _ in range(self.shards)]
+        for update in updates:
+            batches[shard_of(update[2], self.shards)].append(update)
+        for shard in range(self.shards):
+            self._send(shard, 'apply_updates', (batches[shard],), None)
+        self._gather(None)
+
+    def _batches(self, prefixes: List[List]) -> List[List[int]]:
+        """Return the indexes in <prefixes> of the prefixes that match values
+        in each shard, by shard.
+
+        The empty prefix matches values in every shard.
+        """
+        batches = [[] for _ in range(self.shards)]
+        for i in range(len(prefixes)):
+            if prefixes[i]:
+                batches[shard_of(prefixes[i], self.shards)].append(i)
+            else:
+                for batch in batches:
+                    batch.append(i)
+        return batches
+
+    def set_removal_threshold(self, threshold: int) -> None:
+        """Set the removal threshold of every shard.
+
+        See SimplePrefixTree.set_removal_threshold.
+        """
+        self._scatter('set_removal_threshold', (threshold,))
+
+    def compact(self) -> None:
+        """Compact every shard.
+        """
+        self._scatter('compact', ())
+
+    def close(self) -> None:
+        """Stop the worker processes.
+        """
+        for conn in self._conns:
+            conn.send(None)
+            conn.close()
+        for process in self._processes:
+            process.join()
+        self._conns = []
+        self._processes = []
+        self.shards = 0
@@ -101,5 +101,45 @@ class SimpleAutoCompleteTest(unittest.TestCase):
         self.assertEqual(self.sum_tree.autocomplete(['a'], 3), expected)
 
 
+    def test_limit_returns_heaviest_leaves(self):
+        self.sum_tree.insert('cat', 2, ['c', 'a', 't'])
+        self.sum_tree.insert('car', 3, ['c', 'a', 'r'])
+        self.sum_tree.insert('dog', 4, ['d', 'o', 'g'])
+        expected = [('dog', 4.0), ('car', 3.0)]
+        self.assertEqual(self.sum_tree.autocomplete([], 2), expected)
+
+    def test_max_tree_limit_returns_heaviest_leaves(self):
+        tree = SimplePrefixTree('max')
+        tree.insert('cat', 2, ['c', 'a', 't'])
+        tree.insert('cab', 1, ['c', 'a', 'b'])
+        tree.insert('car', 5, ['c', 'a', 'r'])
+        tree.insert('dog', 4, ['d', 'o', 'g'])
+        tree.insert('do', 3, ['d', 'o'])
+        expected = [('car', 5.0), ('dog', 4.0), ('do', 3.0)]
+        self.assertEqual(tree.autocomplete([], 3), expected)
+        self.assertEqual(tree.autocomplete(['c', 'a'], 2),
+                         [('car', 5.0), ('cat', 2.0)])
+
+    def test_autocomplete_many(self):
+        self.sum_tree.insert('cat', 2, ['c', 'a', 't'])
+        self.sum_tree.insert('car', 3, ['c', 'a', 'r'])
+        self.sum_tree.insert('dog', 4, ['d', 'o', 'g'])
+        prefixes = [['d'], ['c', 'a', 't'], [], ['c', 'a'], ['x'], ['d']]
+        expected = [self.sum_tree.autocomplete(prefix, 2)
+                    for prefix in prefixes]
+        self.assertEqual(self.sum_tree.autocomplete_many(prefixes, 2),
+                         expected)
+
+    def test_autocomplete_fuzzy(self):
+        self.sum_tree.insert('cat', 2, ['c', 'a', 't'])
+        self.sum_tree.insert('car', 3, ['c', 'a', 'r'])
+        self.sum_tree.insert('dog', 4, ['d', 'o', 'g'])
+        self.assertEqual(self.sum_tree.autocomplete_fuzzy(['c', 'a'], 0),
+                         [('car', 3.0), ('cat', 2.0)])
+        self.assertEqual(self.sum_tree.autocomplete_fuzzy(['x', 'a', 't'], 1),
+                         [('cat', 2.0)])
+        self.assertEqual(self.sum_tree.autocomplete_fuzzy(['d', 'a'], 1, 2),
+                         [('dog', 4.0), ('car', 3.0)])
+
 if __name__ == '__main__':
     unittest.main()
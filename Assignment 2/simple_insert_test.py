@@ -127,6 +127,24 @@ class SimpleInsertTest(unittest.TestCase):
                    "[Tree(ab (10.0))]), Tree(['a', 'c'] (6.0) [Tree(ac (6.0))])])])"
 
         self.assertEqual(repr_tree(self.avg_tree), expected)
+    def test_insert_max_weight(self):
+        tree = SimplePrefixTree('max')
+        tree.insert('ab', 4, ['a', 'b'])
+        tree.insert('ac', 6, ['a', 'c'])
+        tree.insert('ab', 3, ['a', 'b'])
+        expected = "Tree([] (7.0) [Tree(['a'] (7.0) [Tree(['a', 'b'] (7.0) " \
+                   "[Tree(ab (7.0))]), Tree(['a', 'c'] (6.0) [Tree(ac (6.0))])])])"
+        self.assertEqual(repr_tree(tree), expected)
+
+    def test_insert_unhashable_values(self):
+        tree = SimplePrefixTree('sum')
+        for i in range(12):
+            tree.insert([i], 1.0, ['a'])
+        tree.insert([3], 20.0, ['a'])
+        self.assertEqual(len(tree), 12)
+        self.assertEqual(tree.autocomplete(['a'], 2), [([3], 21.0),
+                                                       ([0], 1.0)])
+
 
 
 
@@ -71,5 +71,19 @@ class SimpleAutoCompleteTest(unittest.TestCase):
         expected = "Tree([] (6.0) [Tree(['a'] (6.0) [Tree(Alice (6.0)), Tree(['a', 'b'] (6.0) [Tree(Bob (6.0))])])])"
         self.assertEqual(repr_tree(self.avg_tree), expected)
 
+    def test_len_after_insert_and_remove(self):
+        for tree in [self.sum_tree, self.avg_tree]:
+            tree.insert('Alice', 6, ['a'])
+            tree.insert('Bob', 6, ['a', 'b'])
+            tree.insert('Bob', 2, ['a', 'b'])
+            tree.insert('Jacky', 4, ['b', 'c'])
+            self.assertEqual(len(tree), 3)
+            self.assertEqual(tree.leaf_weight(), 18)
+            tree.remove(['a', 'b'])
+            self.assertEqual(len(tree), 2)
+            self.assertEqual(len(tree.subtrees[0]), 1)
+            tree.remove([])
+            self.assertEqual(len(tree), 0)
+
 if __name__ == '__main__':
     unittest.main()
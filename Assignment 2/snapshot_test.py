@@ -0,0 +1,106 @@
+import os
+import tempfile
+import unittest
+from prefix_tree import SimplePrefixTree, CompressedPrefixTree, \
+    FrozenPrefixTree, load_tree
+from tree_test_helpers import repr_tree, fill
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'tree.ptre')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_round_trip_simple(self):
+        for weight_type in ['sum', 'average']:
+            tree = fill(SimplePrefixTree(weight_type))
+            tree.save(self.path)
+            loaded = SimplePrefixTree.load(self.path)
+            self.assertEqual(loaded.w_type, weight_type)
+            self.assertEqual(repr_tree(loaded), repr_tree(tree))
+            self.assertEqual(len(loaded), 5)
+            self.assertEqual(loaded.autocomplete(['c'], 2),
+                             tree.autocomplete(['c'], 2))
+
+    def test_round_trip_compressed(self):
+        for weight_type in ['sum', 'average']:
+            tree = fill(CompressedPrefixTree(weight_type))
+            tree.save(self.path)
+            loaded = CompressedPrefixTree.load(self.path)
+            self.assertEqual(loaded.w_type, weight_type)
+            self.assertEqual(repr_tree(loaded), repr_tree(tree))
+            self.assertEqual(loaded.autocomplete(['d', 'a']),
+                             [('danger', 6.0)])
+
+    def test_round_trip_empty(self):
+        CompressedPrefixTree('sum').save(self.path)
+        loaded = load_tree(self.path)
+        self.assertIsInstance(loaded, CompressedPrefixTree)
+        self.assertEqual(repr_tree(loaded), '')
+        self.assertEqual(loaded.autocomplete([]), [])
+
+    def test_insert_after_load(self):
+        fill(CompressedPrefixTree('sum')).save(self.path)
+        loaded = load_tree(self.path)
+        loaded.insert('cab', 1.0, ['c', 'a', 'b'])
+        loaded.insert('dog', 50.0, ['d', 'o', 'g'])
+        expected = [('dog', 50.0), ('door', 4.0)]
+        self.assertEqual(loaded.autocomplete(['d', 'o']), expected)
+        self.assertEqual(len(loaded.autocomplete(['c', 'a'])), 4)
+        self.assertEqual(len(loaded), 7)
+
+    def test_int_prefix_elements(self):
+        tree = SimplePrefixTree('sum')
+        tree.insert('up', 1.0, [2, 2])
+        tree.insert('down', 2.0, [-2, 2])
+        tree.save(self.path)
+        loaded = load_tree(self.path)
+        self.assertEqual(loaded.subtrees[0].value, [-2])
+        self.assertEqual(loaded.autocomplete([2]), [('up', 1.0)])
+
+    def test_load_wrong_class(self):
+        fill(SimplePrefixTree('sum')).save(self.path)
+        self.assertRaises(ValueError, CompressedPrefixTree.load, self.path)
+
+    def test_unsupported_value(self):
+        tree = SimplePrefixTree('sum')
+        tree.insert(object(), 1.0, ['a'])
+        self.assertRaises(TypeError, tree.save, self.path)
+
+
+class FrozenPrefixTreeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'tree.ptre')
+        self.tree = fill(CompressedPrefixTree('sum'))
+        self.tree.save(self.path)
+        self.frozen = FrozenPrefixTree(self.path)
+
+    def tearDown(self):
+        self.frozen.close()
+        self.dir.cleanup()
+
+    def test_same_results(self):
+        for prefix in [[], ['c'], ['c', 'a', 'r'], ['d', 'a'], ['d', 'x'],
+                       ['c', 'a', 'r', 'e', 's']]:
+            self.assertEqual(self.frozen.autocomplete(prefix),
+                             self.tree.autocomplete(prefix))
+            self.assertEqual(self.frozen.autocomplete(prefix, 2),
+                             self.tree.autocomplete(prefix, 2))
+
+    def test_len(self):
+        self.assertEqual(len(self.frozen), 5)
+
+    def test_read_only(self):
+        self.assertRaises(TypeError, self.frozen.insert, 'cab', 1.0,
+                          ['c', 'a', 'b'])
+        self.assertRaises(TypeError, self.frozen.remove, ['c'])
+
+
+if __name__ == '__main__':
+    unittest.main()
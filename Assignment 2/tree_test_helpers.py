@@ -0,0 +1,29 @@
+"""CSC148 Assignment 2: Test helpers
+
+=== Module description ===
+This file contains the prefix tree fixture and the tree printer shared by the
+unit tests of the prefix tree features.
+"""
+# The values the fixture trees are filled with, in the order they are
+# inserted, as (value, weight, prefix) tuples.
+ITEMS = [('car', 100.0, ['c', 'a', 'r']),
+         ('door', 4.0, ['d', 'o', 'o', 'r']),
+         ('danger', 6.0, ['d', 'a', 'n', 'g', 'e', 'r']),
+         ('cat', 20.0, ['c', 'a', 't']),
+         ('care', 30.0, ['c', 'a', 'r', 'e'])]
+
+
+def repr_tree(t):
+    if t.is_empty():
+        return ''
+    template = "Tree({} ({})"
+    subtrees = ', '.join([repr_tree(s) for s in t.subtrees])
+    if subtrees:
+        subtrees = ' [' + subtrees + ']'
+    return template.format(t.value, float(t.weight)) + subtrees + ')'
+
+
+def fill(tree, items=ITEMS):
+    for value, weight, prefix in items:
+        tree.insert(value, weight, prefix)
+    return tree